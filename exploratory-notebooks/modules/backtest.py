@@ -0,0 +1,161 @@
+"""Walk-forward backtests of the prediction models."""
+import numpy as np
+import pandas as pd
+from multiprocessing import Pool
+from sklearn.metrics import r2_score, mean_squared_error
+from .prediction import PrecrimeSplit
+from .ensemble import run_model
+
+
+_backtest_data = None
+
+
+def get_month_ids(merged_data):
+    """Number each row's month, counting from 1970-01."""
+    return (
+        12 * (merged_data['COMPLAINT_YEAR'].values.astype(np.int64) - 1970) +
+        merged_data['COMPLAINT_MONTH'].values.astype(np.int64) - 1
+    )
+
+
+def get_walk_forward_folds(merged_data, first_test_month, last_test_month,
+                           train_months=None):
+    """Make walk-forward train/test folds, one per month.
+
+    The fold for test month M+1 trains on everything through month M
+    (or only the last train_months months) and tests on month M+1.
+
+    Parameters
+    ----------
+    merged_data : DataFrame
+        A DataFrame with columns 'COMPLAINT_YEAR' and 'COMPLAINT_MONTH'
+    first_test_month, last_test_month : dates or strings like '2016-01'
+        Test on each month in [first_test_month, last_test_month)
+    train_months : integer, optional
+        If given, use a rolling window of this many months of training
+        data instead of everything before the test month.
+
+    Returns
+    -------
+    folds : list of (test_month, train_idx, test_idx)
+        test_month is a datetime64[M]. train_idx and test_idx are row
+        positions in merged_data, as returned by get_split_indices.
+    """
+    month_ids = get_month_ids(merged_data)
+    test_months = np.arange(
+        np.datetime64(first_test_month, 'M'),
+        np.datetime64(last_test_month, 'M')
+    )
+    folds = []
+    for test_month in test_months:
+        test_id = test_month.astype(np.int64)
+        is_train = month_ids < test_id
+        if train_months is not None:
+            is_train &= month_ids >= test_id - train_months
+        folds.append((
+            test_month,
+            np.flatnonzero(is_train),
+            np.flatnonzero(month_ids == test_id),
+        ))
+    return folds
+
+
+def score_predictions(y_test, y_pred):
+    """Compute R2 and RMSE for each crime type, as in eval_predictions.
+
+    Returns
+    -------
+    scores : DataFrame
+        Indexed by crime type, with columns 'R2', 'RMSE' and 'RMSE_PCT'
+    """
+    crime_types = y_test.select_dtypes(exclude=['object']).columns
+    scores = pd.DataFrame(
+        index=pd.Index(crime_types, name='CRIME_TYPE'),
+        columns=['R2', 'RMSE', 'RMSE_PCT'],
+        dtype=np.float64
+    )
+    for crime_type in crime_types:
+        y_t = y_test[crime_type].values
+        y_p = y_pred.loc[y_test.index, crime_type].values
+        rmse = np.sqrt(mean_squared_error(y_t, y_p))
+        scores.loc[crime_type] = [
+            r2_score(y_t, y_p), rmse, 100 * rmse / np.mean(y_t)
+        ]
+    return scores
+
+
+def _init_backtest_worker(merged_data):
+    """Keep the merged data in each worker so folds only send indices."""
+    global _backtest_data
+    _backtest_data = merged_data
+
+
+def _run_fold(task):
+    """Fit and score one model on one fold of _backtest_data."""
+    model, test_month, train_idx, test_idx = task
+    X_train, X_test, y_train, y_test = PrecrimeSplit(
+        _backtest_data, train_idx, test_idx
+    )
+    y_pred = run_model(model, X_train, y_train, X_test, y_test)
+    return test_month, y_pred, score_predictions(y_test, y_pred)
+
+
+def run_backtest(model, merged_data, first_test_month, last_test_month,
+                 train_months=None, n_jobs=None):
+    """Run a walk-forward backtest of a model.
+
+    Parameters
+    ----------
+    model : function
+        A top-level function that takes (X_train, y_train, X_test) and
+        returns y_pred, like prediction.sample_model. Models with a
+        y_test parameter, like the time series models or an
+        EnsembleModel, are given the fold's y_test too.
+    merged_data : DataFrame
+        The data, in the format returned by load_all_data()
+    first_test_month, last_test_month : dates or strings like '2016-01'
+        Test on each month in [first_test_month, last_test_month)
+    train_months : integer, optional
+        If given, train on a rolling window of this many months.
+    n_jobs : integer, optional
+        The number of worker processes. Each worker gets the merged data
+        once, and the folds only send row positions. If n_jobs is 1, the
+        folds are run one at a time in this process.
+
+    Returns
+    -------
+    y_pred : DataFrame
+        The predictions for every test month, in fold order
+    scores : DataFrame
+        R2, RMSE and RMSE_PCT for each test month and crime type
+    """
+    folds = get_walk_forward_folds(
+        merged_data, first_test_month, last_test_month, train_months
+    )
+    # Months with no training or test data have nothing to score.
+    tasks = [
+        (model,) + fold for fold in folds
+        if len(fold[1]) > 0 and len(fold[2]) > 0
+    ]
+    if n_jobs == 1:
+        _init_backtest_worker(merged_data)
+        try:
+            results = [_run_fold(task) for task in tasks]
+        finally:
+            _init_backtest_worker(None)
+    else:
+        with Pool(
+            n_jobs,
+            initializer=_init_backtest_worker,
+            initargs=(merged_data,)
+        ) as pool:
+            results = pool.map(_run_fold, tasks, chunksize=1)
+
+    test_months = [str(test_month) for test_month, _, _ in results]
+    y_pred = pd.concat([fold_pred for _, fold_pred, _ in results])
+    scores = pd.concat(
+        [fold_scores for _, _, fold_scores in results],
+        keys=test_months,
+        names=['TEST_MONTH']
+    )
+    return y_pred, scores
@@ -0,0 +1,169 @@
+"""A precomputed table of the calendar attributes of every day."""
+import numpy as np
+import pandas as pd
+
+
+_FIRST_YEAR = 2006
+_LAST_YEAR = 2030
+
+_calendar = None
+
+
+class Calendar(object):
+    """The attributes of every day from first_year through last_year.
+
+    Each attribute is an array indexed by day number, which counts days
+    from the first of January of first_year. Days are found from their
+    year, month and day with a table of the day numbers of the first of
+    each month, so looking them up takes only integer indexing.
+
+    Parameters
+    ----------
+    first_year, last_year : integers, optional
+
+    Attributes
+    ----------
+    dates : ndarray of datetime64[D]
+    day_ordinals : ndarray of int64
+        Days since 1970-01-01
+    years, months, days : ndarrays of int64
+    decimal_dates : ndarray of float64
+        The year plus the fraction of the year before the day
+    year_fracs : ndarray of float64
+        The fraction of the year before the day
+    weekdays : ndarray of int64
+        Monday is 0, as in COMPLAINT_DAYOFWEEK
+    slot_ids : ndarray of int64
+        The id of the day's first four-hour time slot, counting from
+        1970-01-01. Hourgroup h of the day is slot slot_ids + h // 4.
+    """
+
+    def __init__(self, first_year=_FIRST_YEAR, last_year=_LAST_YEAR):
+        self.first_year = first_year
+        self.last_year = last_year
+        year_starts = np.arange(
+            first_year - 1970, last_year - 1970 + 2
+        ).astype('<M8[Y]').astype('<M8[D]')
+        month_starts = np.arange(
+            12 * (first_year - 1970), 12 * (last_year - 1970 + 1) + 1
+        ).astype('<M8[M]').astype('<M8[D]')
+        self.dates = np.arange(year_starts[0], year_starts[-1])
+        self.day_ordinals = self.dates.astype(np.int64)
+        self.month_starts = (
+            month_starts.astype(np.int64) - self.day_ordinals[0]
+        )
+
+        year_idx = np.repeat(
+            np.arange(len(year_starts) - 1), np.diff(year_starts).astype(int)
+        )
+        month_idx = np.repeat(
+            np.arange(len(month_starts) - 1), np.diff(self.month_starts)
+        )
+        self.years = first_year + year_idx
+        self.months = month_idx % 12 + 1
+        self.days = (
+            np.arange(len(self.dates)) - self.month_starts[month_idx] + 1
+        )
+        year_start = year_starts[year_idx]
+        self.year_fracs = (
+            (self.dates - year_start) /
+            (year_starts[year_idx + 1] - year_start)
+        )
+        self.decimal_dates = self.years + self.year_fracs
+        self.weekdays = (self.day_ordinals + 3) % 7
+        self.slot_ids = 6 * self.day_ordinals
+
+    def __len__(self):
+        return len(self.dates)
+
+    def get_day_numbers(self, year, month, day):
+        """Find the day numbers of some dates.
+
+        Parameters
+        ----------
+        year, month, day : array-like of integers
+
+        Returns
+        -------
+        day_numbers : ndarray of int64
+        """
+        return self.month_starts[
+            12 * (np.asarray(year, dtype=np.int64) - self.first_year) +
+            np.asarray(month, dtype=np.int64) - 1
+        ] + np.asarray(day, dtype=np.int64) - 1
+
+    def to_frame(self):
+        """Return the calendar as a DataFrame indexed by day number."""
+        calendar_table = pd.DataFrame({
+            'DATE': self.dates,
+            'DAY_ORDINAL': self.day_ordinals,
+            'YEAR': self.years,
+            'MONTH': self.months,
+            'DAY': self.days,
+            'DECIMAL_DATE': self.decimal_dates,
+            'YEAR_FRAC': self.year_fracs,
+            'DAYOFWEEK': self.weekdays,
+            'SLOT_ID': self.slot_ids,
+        })
+        calendar_table.index.rename('DAY_NUMBER', inplace=True)
+        return calendar_table
+
+
+def get_calendar(first_year=None, last_year=None):
+    """Return the shared calendar, covering at least the given years.
+
+    The calendar covers 2006 through 2030 unless it has been asked for
+    more, in which case it is rebuilt to cover the new years too.
+    """
+    global _calendar
+    if _calendar is None:
+        _calendar = Calendar()
+    if ((first_year is not None and first_year < _calendar.first_year) or
+            (last_year is not None and last_year > _calendar.last_year)):
+        _calendar = Calendar(
+            min(_calendar.first_year, first_year or _calendar.first_year),
+            max(_calendar.last_year, last_year or _calendar.last_year)
+        )
+    return _calendar
+
+
+def lookup_days(year, month, day):
+    """Return the shared calendar and the day numbers of some dates."""
+    year = np.asarray(year, dtype=np.int64)
+    if year.size == 0:
+        calendar = get_calendar()
+    else:
+        calendar = get_calendar(int(year.min()), int(year.max()))
+    return calendar, calendar.get_day_numbers(year, month, day)
+
+
+def get_day_ordinals(year, month, day):
+    """Number each date in days from 1970-01-01."""
+    calendar, day_numbers = lookup_days(year, month, day)
+    return calendar.day_ordinals[day_numbers]
+
+
+def get_year_fractions(year, month, day):
+    """Return each date as a decimal year and as a fraction of its year."""
+    calendar, day_numbers = lookup_days(year, month, day)
+    return (
+        calendar.decimal_dates[day_numbers], calendar.year_fracs[day_numbers]
+    )
+
+
+def get_slot_ids(year, month, day, hourgroup):
+    """Number each four-hour time slot, counting from 1970-01-01.
+
+    Parameters
+    ----------
+    year, month, day, hourgroup : array-like of integers
+
+    Returns
+    -------
+    slot_ids : ndarray of int64
+    """
+    calendar, day_numbers = lookup_days(year, month, day)
+    return (
+        calendar.slot_ids[day_numbers] +
+        np.asarray(hourgroup, dtype=np.int64) // 4
+    )
@@ -0,0 +1,513 @@
+"""Functions for storing felony counts as a dense array."""
+import numpy as np
+import pandas as pd
+import json
+import os
+import struct
+
+# Count cube files start with this, followed by the length of a JSON
+# header describing the axes. The counts start at _HEADER_BYTES.
+_CUBE_MAGIC = b'PRECRIME_CUBE_01'
+_HEADER_BYTES = 4096
+
+
+class ComplaintIds(object):
+    """The complaint ids in each cell, stored as a ragged array.
+
+    The ids for every cell are kept in one sorted array, and
+    ids[offsets[i]:offsets[i + 1]] are the ids for cell i.
+
+    Attributes
+    ----------
+    ids : ndarray of int64
+        Complaint ids, sorted by cell and then by id
+    offsets : ndarray of int64
+        One more entry than there are cells
+    """
+
+    def __init__(self, ids, offsets):
+        self.ids = ids
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, cell):
+        """Return the ids in a cell, as a view into the ids array."""
+        return self.ids[self.offsets[cell]:self.offsets[cell + 1]]
+
+    def to_strings(self):
+        """Return the ids in each cell as space-separated strings."""
+        return [' '.join(str(i) for i in self[cell])
+                for cell in range(len(self))]
+
+
+class CountCube(object):
+    """Felony counts by day, hourgroup, precinct, and offense.
+
+    Attributes
+    ----------
+    days : ndarray of datetime64[D]
+        Every day from the first to the last day in the data
+    hourgroups : ndarray of integers
+    precincts : ndarray of integers
+    offenses : list of strings
+    counts : ndarray of int32
+        counts[i, j, k, l] is the number of complaints on days[i] in
+        hourgroups[j] in precincts[k] for offenses[l]
+    complaint_ids : ComplaintIds or None
+        The complaint ids in each (day, hourgroup, precinct) cell, in the
+        same order as the rows of to_frame()
+    """
+
+    def __init__(self, days, hourgroups, precincts, offenses, counts,
+                 complaint_ids=None):
+        self.days = days
+        self.hourgroups = hourgroups
+        self.precincts = precincts
+        self.offenses = offenses
+        self.counts = counts
+        self.complaint_ids = complaint_ids
+
+    @property
+    def shape(self):
+        return self.counts.shape
+
+    def cell_index(self):
+        """Return a DataFrame of the (day, hourgroup, precinct) cells.
+
+        There is one row per cell, in the same order as
+        counts.reshape(-1, len(offenses)).
+        """
+        n_days, n_hourgroups, n_precincts, _ = self.counts.shape
+        dates = pd.DatetimeIndex(
+            np.repeat(self.days, n_hourgroups * n_precincts)
+        )
+        return pd.DataFrame({
+            'COMPLAINT_YEAR': dates.year.astype(np.int64),
+            'COMPLAINT_MONTH': dates.month.astype(np.int64),
+            'COMPLAINT_DAY': dates.day.astype(np.int64),
+            'COMPLAINT_HOURGROUP': np.tile(
+                np.repeat(self.hourgroups, n_precincts), n_days
+            ).astype(np.int64),
+            'ADDR_PCT_CD': np.tile(
+                self.precincts, n_days * n_hourgroups
+            ).astype(np.int64),
+            'COMPLAINT_DAYOFWEEK': dates.dayofweek.astype(np.int64),
+        })
+
+    def slice_days(self, first_date=None, last_date=None):
+        """Return a cube covering only the days in [first_date, last_date).
+
+        The counts and complaint ids are views into this cube's arrays,
+        so nothing is copied (or read from disk, for a memory-mapped cube).
+        """
+        first_idx = 0
+        last_idx = len(self.days)
+        if first_date is not None:
+            first_idx = np.searchsorted(
+                self.days, np.datetime64(first_date, 'D')
+            )
+        if last_date is not None:
+            last_idx = np.searchsorted(
+                self.days, np.datetime64(last_date, 'D')
+            )
+        complaint_ids = None
+        if self.complaint_ids is not None:
+            cells_per_day = int(np.prod(self.counts.shape[1:3]))
+            complaint_ids = ComplaintIds(
+                self.complaint_ids.ids,
+                self.complaint_ids.offsets[
+                    first_idx * cells_per_day:last_idx * cells_per_day + 1
+                ]
+            )
+        return CountCube(
+            self.days[first_idx:last_idx],
+            self.hourgroups,
+            self.precincts,
+            self.offenses,
+            self.counts[first_idx:last_idx],
+            complaint_ids
+        )
+
+    def to_frame(self, offenses=None):
+        """Return the counts as a DataFrame in the format of pivot_felonies.
+
+        The index is (COMPLAINT_YEAR, COMPLAINT_MONTH, COMPLAINT_DAY,
+        COMPLAINT_HOURGROUP, ADDR_PCT_CD), and there is a
+        COMPLAINT_DAYOFWEEK column followed by one column per offense
+        (or only the given offenses).
+        """
+        frame = self.cell_index()
+        counts = self.counts.reshape(-1, len(self.offenses))
+        for i, offense in enumerate(self.offenses):
+            if offenses is None or offense in offenses:
+                frame[offense] = counts[:, i]
+        frame.set_index([
+                'COMPLAINT_YEAR', 'COMPLAINT_MONTH', 'COMPLAINT_DAY',
+                'COMPLAINT_HOURGROUP', 'ADDR_PCT_CD'
+            ],
+            inplace=True
+        )
+        return frame
+
+
+def get_cube_coordinates(nypd_data, first_day, hourgroups, precincts):
+    """Find the (day, hourgroup, precinct) position of each complaint.
+
+    Parameters
+    ----------
+    nypd_data : DataFrame
+        Complaints with 'COMPLAINT_DATETIME', 'COMPLAINT_HOURGROUP', and
+        'ADDR_PCT_CD' columns
+    first_day : datetime64[D]
+        The day at position 0
+    hourgroups : ndarray
+        Sorted hourgroups
+    precincts : ndarray
+        Sorted precinct codes
+
+    Returns
+    -------
+    day_idx, hourgroup_idx, precinct_idx : ndarrays of integers
+    """
+    days = nypd_data['COMPLAINT_DATETIME'].values.astype('<M8[D]')
+    day_idx = (days - first_day).astype(np.int64)
+    hourgroup_idx = np.searchsorted(
+        hourgroups, nypd_data['COMPLAINT_HOURGROUP'].values
+    )
+    precinct_idx = np.searchsorted(
+        precincts, nypd_data['ADDR_PCT_CD'].values
+    )
+    return day_idx, hourgroup_idx, precinct_idx
+
+
+def build_count_cube(nypd_data):
+    """Count the complaints in every day, hourgroup, precinct and offense.
+
+    Each complaint is mapped to integer coordinates, and all of the
+    counts are accumulated with a single np.bincount.
+
+    Parameters
+    ----------
+    nypd_data : DataFrame
+        Complaints with the columns added by add_offense_category and
+        add_datetime_columns
+
+    Returns
+    -------
+    cube : CountCube
+        Days run from the first to the last complaint. The hourgroups and
+        precincts are the ones that appear in the data, and the offenses
+        are the categories of the 'OFFENSE' column.
+    """
+    days = nypd_data['COMPLAINT_DATETIME'].values.astype('<M8[D]')
+    first_day = days.min()
+    n_days = int((days.max() - first_day).astype(np.int64)) + 1
+    all_days = first_day + np.arange(n_days)
+    hourgroups = np.unique(nypd_data['COMPLAINT_HOURGROUP'].values)
+    precincts = np.unique(nypd_data['ADDR_PCT_CD'].values)
+    offenses = list(nypd_data['OFFENSE'].cat.categories)
+
+    day_idx, hourgroup_idx, precinct_idx = get_cube_coordinates(
+        nypd_data, first_day, hourgroups, precincts
+    )
+    offense_idx = nypd_data['OFFENSE'].cat.codes.values.astype(np.int64)
+
+    shape = (n_days, len(hourgroups), len(precincts), len(offenses))
+    flat_idx = np.ravel_multi_index(
+        (day_idx, hourgroup_idx, precinct_idx, offense_idx), shape
+    )
+    counts = np.bincount(
+        flat_idx, minlength=int(np.prod(shape))
+    ).astype(np.int32).reshape(shape)
+
+    cell_idx = np.ravel_multi_index(
+        (day_idx, hourgroup_idx, precinct_idx), shape[:3]
+    )
+    complaint_ids = make_complaint_ids(
+        nypd_data.index.values, cell_idx, int(np.prod(shape[:3]))
+    )
+    return CountCube(
+        all_days, hourgroups, precincts, offenses, counts, complaint_ids
+    )
+
+
+def make_complaint_ids(ids, cell_idx, n_cells):
+    """Group complaint ids by cell.
+
+    Parameters
+    ----------
+    ids : ndarray
+        The id of each complaint
+    cell_idx : ndarray of integers
+        The cell each complaint belongs to
+    n_cells : integer
+
+    Returns
+    -------
+    complaint_ids : ComplaintIds
+    """
+    order = np.lexsort((ids, cell_idx))
+    offsets = np.zeros(n_cells + 1, dtype=np.int64)
+    np.cumsum(np.bincount(cell_idx, minlength=n_cells), out=offsets[1:])
+    return ComplaintIds(ids[order].astype(np.int64), offsets)
+
+
+def save_complaint_ids(complaint_ids, filepath):
+    """Save the complaint ids to a .npz file."""
+    np.savez(filepath, ids=complaint_ids.ids, offsets=complaint_ids.offsets)
+
+
+def load_complaint_ids(filepath):
+    """Load complaint ids saved by save_complaint_ids."""
+    with np.load(filepath) as saved:
+        return ComplaintIds(saved['ids'], saved['offsets'])
+
+
+def _grow_axis(axis, values):
+    """Add any new values to a sorted axis.
+
+    Returns the new axis and the new positions of the old entries.
+    """
+    new_axis = np.union1d(axis, values).astype(axis.dtype)
+    return new_axis, np.searchsorted(new_axis, axis)
+
+
+def update_count_cube(cube, new_data):
+    """Add new complaints to a count cube.
+
+    New days are appended to the end of the cube, and only the cells
+    the new complaints fall into are updated. The hourgroup and precinct
+    axes are only rebuilt if the new data has values they don't have.
+
+    Parameters
+    ----------
+    cube : CountCube
+    new_data : DataFrame
+        Complaints that aren't already in the cube, in the same format
+        as the data passed to build_count_cube. Nothing checks this, so
+        passing the same complaints again counts them twice.
+
+    If the counts are memory-mapped with mode 'r+', they are updated in
+    the file itself, and new days are added by growing the file. The
+    file is only left behind (and the counts moved into memory) if the
+    hourgroup or precinct axes have to grow.
+
+    Returns
+    -------
+    cube : CountCube
+        The updated cube (the arrays are replaced if they had to grow)
+    first_changed_day : integer
+        The position of the first day whose counts changed
+    """
+    days = new_data['COMPLAINT_DATETIME'].values.astype('<M8[D]')
+    if days.min() < cube.days[0]:
+        raise ValueError(
+            'New complaints start on {0}, before the cube starts on {1}'
+            .format(days.min(), cube.days[0])
+        )
+    offense_idx = pd.Categorical(
+        new_data['OFFENSE'], categories=cube.offenses
+    ).codes.astype(np.int64)
+    if (offense_idx < 0).any():
+        raise ValueError('New complaints have unknown offense categories')
+
+    counts = cube.counts
+    complaint_ids = cube.complaint_ids
+    n_old_cells = int(np.prod(counts.shape[:3]))
+    old_cells = None
+
+    hourgroups, hourgroup_pos = _grow_axis(
+        cube.hourgroups, new_data['COMPLAINT_HOURGROUP'].values
+    )
+    precincts, precinct_pos = _grow_axis(
+        cube.precincts, new_data['ADDR_PCT_CD'].values
+    )
+    if (len(hourgroups) != len(cube.hourgroups) or
+            len(precincts) != len(cube.precincts)):
+        # Spread the existing counts out over the bigger axes.
+        new_counts = np.zeros(
+            (counts.shape[0], len(hourgroups), len(precincts),
+             counts.shape[3]),
+            dtype=counts.dtype
+        )
+        new_counts[:, hourgroup_pos[:, None], precinct_pos, :] = counts
+        counts = new_counts
+        if complaint_ids is not None:
+            day_old, hourgroup_old, precinct_old = np.unravel_index(
+                np.repeat(
+                    np.arange(n_old_cells), np.diff(complaint_ids.offsets)
+                ),
+                cube.counts.shape[:3]
+            )
+            old_cells = np.ravel_multi_index(
+                (day_old, hourgroup_pos[hourgroup_old],
+                 precinct_pos[precinct_old]),
+                counts.shape[:3]
+            )
+
+    n_new_days = int((days.max() - cube.days[-1]).astype(np.int64))
+    all_days = cube.days
+    if n_new_days > 0:
+        all_days = cube.days[0] + np.arange(len(cube.days) + n_new_days)
+        counts = _append_days(counts, n_new_days)
+
+    day_idx, hourgroup_idx, precinct_idx = get_cube_coordinates(
+        new_data, cube.days[0], hourgroups, precincts
+    )
+    np.add.at(counts, (day_idx, hourgroup_idx, precinct_idx, offense_idx), 1)
+
+    if complaint_ids is not None:
+        n_cells = int(np.prod(counts.shape[:3]))
+        new_cells = np.ravel_multi_index(
+            (day_idx, hourgroup_idx, precinct_idx), counts.shape[:3]
+        )
+        if old_cells is None:
+            # Cells are in day order, so everything before the first
+            # changed cell can be kept as it is.
+            first_cell = min(int(new_cells.min()), n_old_cells)
+            keep = complaint_ids.offsets[first_cell]
+            old_cells = np.repeat(
+                np.arange(first_cell, n_old_cells),
+                np.diff(complaint_ids.offsets[first_cell:])
+            )
+        else:
+            first_cell = 0
+            keep = 0
+        tail = make_complaint_ids(
+            np.concatenate([complaint_ids.ids[keep:], new_data.index.values]),
+            np.concatenate([old_cells, new_cells]) - first_cell,
+            n_cells - first_cell
+        )
+        complaint_ids = ComplaintIds(
+            np.concatenate([complaint_ids.ids[:keep], tail.ids]),
+            np.concatenate([
+                complaint_ids.offsets[:first_cell], tail.offsets + keep
+            ])
+        )
+
+    cube = CountCube(
+        all_days, hourgroups, precincts, cube.offenses, counts, complaint_ids
+    )
+    return cube, int(day_idx.min())
+
+
+def _append_days(counts, n_days):
+    """Add n_days days of zero counts to the end of the counts."""
+    if isinstance(counts, np.memmap) and counts.mode == 'r+':
+        filename, offset = counts.filename, counts.offset
+        shape = (counts.shape[0] + n_days,) + counts.shape[1:]
+        counts.flush()
+        with open(filename, 'r+b') as f:
+            header = _read_cube_header(f)
+            header['n_days'] = shape[0]
+            _write_cube_header(f, header)
+            # Growing the file fills the new days with zeros.
+            f.truncate(offset + int(np.prod(shape)) * counts.itemsize)
+        return np.memmap(
+            filename, dtype=counts.dtype, mode='r+', offset=offset,
+            shape=shape
+        )
+    return np.concatenate([
+        counts,
+        np.zeros((n_days,) + counts.shape[1:], dtype=counts.dtype)
+    ])
+
+
+def _write_cube_header(f, header):
+    """Write the header block at the start of a count cube file."""
+    text = json.dumps(header).encode('utf-8')
+    block = _CUBE_MAGIC + struct.pack('<I', len(text)) + text
+    if len(block) > _HEADER_BYTES:
+        raise ValueError('Count cube axes are too long for the header')
+    f.seek(0)
+    f.write(block.ljust(_HEADER_BYTES, b'\0'))
+
+
+def _read_cube_header(f):
+    """Read the header block at the start of a count cube file."""
+    f.seek(0)
+    block = f.read(_HEADER_BYTES)
+    if not block.startswith(_CUBE_MAGIC):
+        raise ValueError('{0} is not a count cube file'.format(f.name))
+    start = len(_CUBE_MAGIC) + 4
+    length = struct.unpack('<I', block[len(_CUBE_MAGIC):start])[0]
+    return json.loads(block[start:start + length].decode('utf-8'))
+
+
+def get_ids_filepath(filepath):
+    """Return where the complaint ids for a count cube file are kept."""
+    return os.path.splitext(filepath)[0] + '_ids.npz'
+
+
+def save_count_cube(cube, filepath, ids_filepath=None):
+    """Save a count cube to disk.
+
+    The file has a small header describing the day, hourgroup, precinct
+    and offense axes, followed by the raw int32 counts in day-major
+    order, so that load_count_cube can memory-map it. The complaint ids
+    are saved separately to ids_filepath (by default, next to filepath).
+    """
+    header = {
+        'first_day': str(cube.days[0]),
+        'n_days': len(cube.days),
+        'hourgroups': [int(h) for h in cube.hourgroups],
+        'precincts': [int(p) for p in cube.precincts],
+        'offenses': list(cube.offenses),
+        'dtype': '<i4',
+    }
+    with open(filepath, 'wb') as f:
+        _write_cube_header(f, header)
+        np.ascontiguousarray(cube.counts, dtype='<i4').tofile(f)
+    if cube.complaint_ids is not None:
+        if ids_filepath is None:
+            ids_filepath = get_ids_filepath(filepath)
+        save_complaint_ids(cube.complaint_ids, ids_filepath)
+
+
+def load_count_cube(filepath, mode='r', ids_filepath=None, with_ids=True):
+    """Memory-map a count cube saved by save_count_cube.
+
+    Parameters
+    ----------
+    filepath : string
+    mode : string, optional, default 'r'
+        The np.memmap mode. Use 'r+' to update the file in place with
+        update_count_cube.
+    ids_filepath : string, optional
+        Where the complaint ids were saved, if not next to filepath
+    with_ids : boolean, optional, default True
+        If False, don't load the complaint ids
+
+    Returns
+    -------
+    cube : CountCube
+        Only the parts of the counts that are used get read from disk,
+        and processes that load the same file share its pages.
+    """
+    with open(filepath, 'rb') as f:
+        header = _read_cube_header(f)
+    shape = (
+        header['n_days'],
+        len(header['hourgroups']),
+        len(header['precincts']),
+        len(header['offenses']),
+    )
+    counts = np.memmap(
+        filepath, dtype=header['dtype'], mode=mode,
+        offset=_HEADER_BYTES, shape=shape
+    )
+    complaint_ids = None
+    if with_ids:
+        if ids_filepath is None:
+            ids_filepath = get_ids_filepath(filepath)
+        complaint_ids = load_complaint_ids(ids_filepath)
+    return CountCube(
+        np.datetime64(header['first_day'], 'D') + np.arange(shape[0]),
+        np.array(header['hourgroups']),
+        np.array(header['precincts']),
+        header['offenses'],
+        counts,
+        complaint_ids
+    )
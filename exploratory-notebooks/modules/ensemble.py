@@ -0,0 +1,163 @@
+"""Combine the predictions of several models."""
+import numpy as np
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from .calendar_dim import get_calendar
+from .features import FeatureCache
+
+
+_KEY_COLUMNS = [
+    'COMPLAINT_YEAR', 'COMPLAINT_MONTH', 'COMPLAINT_DAY',
+    'COMPLAINT_HOURGROUP', 'ADDR_PCT_CD',
+]
+
+
+def get_parameters(model):
+    """Return the parameters of a model, or {} if they can't be found."""
+    try:
+        return inspect.signature(model).parameters
+    except (TypeError, ValueError):
+        return {}
+
+
+def takes_y_test(model):
+    """Check whether a model takes y_test, like the time series models.
+
+    Models say so by having a parameter named y_test.
+    """
+    return 'y_test' in get_parameters(model)
+
+
+def run_model(model, X_train, y_train, X_test, y_test=None, cache=None):
+    """Run a model, passing it y_test and cache if it takes them.
+
+    Parameters
+    ----------
+    model : function
+    X_train, y_train, X_test : DataFrames
+    y_test : DataFrame, optional
+    cache : FeatureCache, optional
+        A cache for X_train and X_test, for models with a cache parameter
+
+    Returns
+    -------
+    y_pred : DataFrame
+    """
+    parameters = get_parameters(model)
+    kwargs = {}
+    if 'y_test' in parameters:
+        if (y_test is None and
+                parameters['y_test'].default is inspect.Parameter.empty):
+            raise ValueError('{0} needs y_test'.format(
+                getattr(model, '__name__', model)
+            ))
+        kwargs['y_test'] = y_test
+    if cache is not None and 'cache' in parameters:
+        kwargs['cache'] = cache
+    return model(X_train, y_train, X_test, **kwargs)
+
+
+class EnsembleModel(object):
+    """A weighted average of the predictions of several models.
+
+    Each call makes a FeatureCache for its X_train and X_test and passes
+    it to the models with a cache parameter, so features that several
+    of them use are only encoded once. The components run at the same
+    time in a pool of threads, and their predictions are blended with
+    one weighted sum over an array of all of them.
+
+    An EnsembleModel can be used anywhere a model function can, for
+    example in run_backtest. It takes y_test and cache, and passes them
+    on to the models that take them.
+
+    Parameters
+    ----------
+    models : list of functions
+        Models that take (X_train, y_train, X_test) and return y_pred.
+        Models can also have a y_test parameter, like
+        fancy_time_series_model, or a cache parameter, like
+        sample_model. Another EnsembleModel has both.
+    weights : list of floats, optional
+        The weight of each model. They are scaled to add up to 1.
+        Defaults to equal weights.
+    n_jobs : integer, optional
+        The number of threads. Defaults to one per model.
+    """
+
+    def __init__(self, models, weights=None, n_jobs=None):
+        self.models = list(models)
+        if weights is None:
+            weights = np.ones(len(self.models))
+        weights = np.asarray(weights, dtype=np.float64)
+        if len(weights) != len(self.models):
+            raise ValueError('Expected {0} weights, got {1}'.format(
+                len(self.models), len(weights)
+            ))
+        self.weights = weights / weights.sum()
+        self.n_jobs = n_jobs
+        self.predictions_ = None
+
+    def __call__(self, X_train, y_train, X_test, y_test=None, cache=None):
+        """Run every model and blend their predictions.
+
+        The predictions of each model are kept in predictions_.
+
+        Parameters
+        ----------
+        X_train, y_train, X_test : DataFrames
+        y_test : DataFrame, optional
+            Needed if any of the models needs it
+        cache : FeatureCache, optional
+            A cache for X_train and X_test to share with the models.
+            Defaults to a new one, used only for this call.
+
+        Returns
+        -------
+        y_pred : DataFrame
+            In the same format as the models' predictions, with the same
+            rows as X_test
+        """
+        # Build the shared calendar up front, not in several threads.
+        years = np.concatenate([
+            X_train['COMPLAINT_YEAR'].values, X_test['COMPLAINT_YEAR'].values
+        ])
+        if len(years) > 0:
+            get_calendar(int(years.min()), int(years.max()))
+
+        if cache is None:
+            cache = FeatureCache(X_train, X_test)
+        n_jobs = self.n_jobs if self.n_jobs is not None else len(self.models)
+        with ThreadPoolExecutor(max_workers=max(n_jobs, 1)) as pool:
+            futures = [
+                pool.submit(
+                    run_model, model, X_train, y_train, X_test, y_test,
+                    cache
+                )
+                for model in self.models
+            ]
+            self.predictions_ = [future.result() for future in futures]
+
+        crime_types = y_train.select_dtypes(exclude=['object']).columns
+        blended = np.tensordot(
+            self.weights,
+            np.stack([
+                (
+                    pred[crime_types] if pred.index.equals(X_test.index)
+                    else pred[crime_types].reindex(X_test.index)
+                ).to_numpy(dtype=np.float64)
+                for pred in self.predictions_
+            ]),
+            axes=1
+        )
+        y_pred = X_test[_KEY_COLUMNS].copy()
+        for i, crime_type in enumerate(crime_types):
+            y_pred[crime_type] = blended[:, i]
+        return y_pred
+
+    def predict_split(self, split):
+        """Run the ensemble on a PrecrimeSplit.
+
+        The split is unpacked once, so every model gets the same objects.
+        """
+        X_train, X_test, y_train, y_test = split
+        return self(X_train, y_train, X_test, y_test)
@@ -1,6 +1,36 @@
 """Functions to make crime predictions using a time-series model."""
 import numpy as np
 import pandas as pd
+from .calendar_dim import get_day_ordinals
+
+
+def get_row_day_ordinals(X):
+    """Number each row's date in days from 1970-01-01."""
+    return get_day_ordinals(
+        X['COMPLAINT_YEAR'], X['COMPLAINT_MONTH'], X['COMPLAINT_DAY']
+    )
+
+
+def get_weekly_prefix_sums(cells):
+    """Sum each cell over the same weekday in all earlier weeks.
+
+    Parameters
+    ----------
+    cells : ndarray
+        An array whose first axis is consecutive days
+
+    Returns
+    -------
+    prefix_sums : ndarray
+        prefix_sums[i] is the sum of cells[i - 7], cells[i - 14], ...
+    """
+    n_days = len(cells)
+    n_weeks = -(-n_days // 7)
+    padded = np.zeros((7 * n_weeks,) + cells.shape[1:], dtype=cells.dtype)
+    padded[:n_days] = cells
+    by_week = padded.reshape((n_weeks, 7) + cells.shape[1:])
+    return (np.cumsum(by_week, axis=0).reshape(padded.shape)[:n_days] -
+            cells)
 
 
 def fancy_time_series_model(X_train, y_train, X_test, y_test):
@@ -11,34 +41,24 @@ def fancy_time_series_model(X_train, y_train, X_test, y_test):
 
     Calculates the total number of crimes over the prior four weeks, then
     multiplies by the fraction to estimate the crimes for a particular bucket.
-    """
-    def get_np_dates(X):
-        y = np.array(X['COMPLAINT_YEAR']-1970, dtype='<M8[Y]')
-        m = np.array(X['COMPLAINT_MONTH']-1, dtype='<m8[M]')
-        d = np.array(X['COMPLAINT_DAY']-1, dtype='<m8[D]')
-        mid_dates = y+m+d
-        return pd.Series(mid_dates, index=X.index)
-
-    def get_one_decimal_date(y, m, d):
-        y_np = np.array([y - 1970], dtype='<M8[Y]')
-        m_np = np.array([m - 1], dtype='<m8[M]')
-        d_np = np.array([d - 1], dtype='<m8[D]')
-        return (y_np + m_np + d_np)[0]
-
-    def get_52_weeks_ago(y, m, d):
-        today_np = get_one_decimal_date(y, m, d)
-        lastyear_np = today_np - np.timedelta64(7 * 52, 'D')
-        return lastyear_np
-
-    def get_4_weeks_ago(y, m, d):
-        today_np = get_one_decimal_date(y, m, d)
-        lastmonth_np = today_np - np.timedelta64(7 * 4, 'D')
-        return lastmonth_np
 
+    The counts are put on a (day, hourgroup, precinct) grid covering the
+    year before the first test day through the last one. Cumulative sums
+    over the day axis (and over the same weekday in earlier weeks) turn
+    every window total into a difference of two lookups.
+    """
     X_all = pd.concat([X_train, X_test])
-    X_all['DECIMAL_DATE'] = get_np_dates(X_all)
     y_all = pd.concat([y_train, y_test])
-    all_all = pd.merge(X_all, y_all, left_index=True, right_index=True)
+    all_all = pd.merge(
+        X_all[[
+            'COMPLAINT_YEAR',
+            'COMPLAINT_MONTH',
+            'COMPLAINT_DAY',
+            'COMPLAINT_HOURGROUP',
+            'ADDR_PCT_CD'
+        ]],
+        y_all, left_index=True, right_index=True
+    )
 
     y_pred = X_test[[
         'COMPLAINT_YEAR',
@@ -47,65 +67,81 @@ def fancy_time_series_model(X_train, y_train, X_test, y_test):
         'COMPLAINT_HOURGROUP',
         'ADDR_PCT_CD'
     ]].copy()
-
-    buckets = X_test[[
-        'COMPLAINT_YEAR',
-        'COMPLAINT_MONTH',
-        'COMPLAINT_DAY',
-        'COMPLAINT_DAYOFWEEK',
-    ]].copy().drop_duplicates()
-    buckets['DECIMAL_DATE'] = get_np_dates(buckets)
-    preds = []
     y_train_dvs = y_train.select_dtypes(exclude=['object']).columns
-    for index, bucket in buckets.iterrows():
-        comparison_fullyear = all_all[
-            (all_all['DECIMAL_DATE'] >= get_52_weeks_ago(
-                bucket['COMPLAINT_YEAR'],
-                bucket['COMPLAINT_MONTH'],
-                bucket['COMPLAINT_DAY'])) &
-            (all_all['DECIMAL_DATE'] < get_one_decimal_date(
-                bucket['COMPLAINT_YEAR'],
-                bucket['COMPLAINT_MONTH'],
-                bucket['COMPLAINT_DAY']))
-        ]
-        total_felonies_last_year = np.sum(
-            comparison_fullyear[y_train_dvs].values
+
+    test_days = get_row_day_ordinals(y_pred)
+    if len(test_days) == 0:
+        first_day = last_day = 0
+    else:
+        first_day = test_days.min() - 7 * 52
+        last_day = test_days.max() + 1
+    n_days = last_day - first_day
+    precincts = np.union1d(all_all['ADDR_PCT_CD'], y_pred['ADDR_PCT_CD'])
+    grid_shape = (n_days, 6, len(precincts))
+
+    def get_cells(X):
+        return (
+            get_row_day_ordinals(X) - first_day,
+            np.asarray(X['COMPLAINT_HOURGROUP']) // 4,
+            np.searchsorted(precincts, np.asarray(X['ADDR_PCT_CD']))
         )
-        comparison_lastmonth = all_all[
-            (all_all['DECIMAL_DATE'] >= get_4_weeks_ago(
-                bucket['COMPLAINT_YEAR'],
-                bucket['COMPLAINT_MONTH'],
-                bucket['COMPLAINT_DAY'])) &
-            (all_all['DECIMAL_DATE'] < get_one_decimal_date(
-                bucket['COMPLAINT_YEAR'],
-                bucket['COMPLAINT_MONTH'],
-                bucket['COMPLAINT_DAY']))
-        ]
-        total_felonies_last_month = np.sum(
-            comparison_lastmonth[y_train_dvs].values
+
+    data_cells = get_cells(all_all)
+    in_grid = (data_cells[0] >= 0) & (data_cells[0] < n_days)
+    data_cells = np.ravel_multi_index(
+        tuple(axis[in_grid] for axis in data_cells), grid_shape
+    )
+    test_cells = get_cells(y_pred)
+    test_day = test_cells[0]
+
+    def get_year_totals(cells):
+        # Totals over the same weekday 1 to 52 weeks before each test row.
+        prefix_sums = get_weekly_prefix_sums(cells.reshape(grid_shape))
+        return (
+            prefix_sums[test_cells] -
+            prefix_sums[(test_day - 7 * 52,) + test_cells[1:]]
         )
 
-        comparison_fullyear_bucketed = comparison_fullyear.groupby([
-            'COMPLAINT_DAYOFWEEK', 'COMPLAINT_HOURGROUP', 'ADDR_PCT_CD'
-        ])[y_train_dvs].sum()
-        fullweek_pred = (
-            comparison_fullyear_bucketed *
-            (total_felonies_last_month / 4) /
-            total_felonies_last_year
-        ).reset_index()
-        pred = fullweek_pred[
-            fullweek_pred['COMPLAINT_DAYOFWEEK'] ==
-            bucket['COMPLAINT_DAYOFWEEK']
-        ].copy()
-        for fld in [
-            'COMPLAINT_YEAR',
-            'COMPLAINT_MONTH',
-            'COMPLAINT_DAY',
-        ]:
-            pred[fld] = bucket[fld]
-        preds.append(pred)
-    all_preds = pd.concat(preds)
-    return y_pred.reset_index().merge(
-        all_preds,
-        how='left'
-    ).set_index('index').fillna(0)
+    year_counts = get_year_totals(
+        np.bincount(data_cells, minlength=np.prod(grid_shape))
+    )
+    daily_totals = 0
+    bucketed = {}
+    for crime_type in y_train_dvs:
+        cells = np.bincount(
+            data_cells,
+            weights=all_all[crime_type].values[in_grid],
+            minlength=np.prod(grid_shape)
+        )
+        if all_all[crime_type].dtype.kind in 'iub':
+            cells = np.round(cells).astype(np.int64)
+        daily_totals = daily_totals + cells.reshape(n_days, -1).sum(axis=1)
+        bucketed[crime_type] = get_year_totals(cells)
+
+    # daily_prefix[i] is the total over the days before day i.
+    daily_prefix = np.concatenate([[0], np.cumsum(daily_totals)])
+    total_felonies_last_year = (
+        daily_prefix[test_day] - daily_prefix[test_day - 7 * 52]
+    )
+    total_felonies_last_month = (
+        daily_prefix[test_day] - daily_prefix[test_day - 7 * 4]
+    )
+
+    # Rows with no history in their bucket got no prediction (and no day
+    # of week) from the groupby this replaces, so they end up as 0.
+    has_history = year_counts > 0
+    dayofweek = X_test['COMPLAINT_DAYOFWEEK'].values
+    if has_history.all():
+        y_pred['COMPLAINT_DAYOFWEEK'] = dayofweek
+    else:
+        y_pred['COMPLAINT_DAYOFWEEK'] = np.where(has_history, dayofweek, 0.)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for crime_type in y_train_dvs:
+            y_pred[crime_type] = np.where(
+                has_history,
+                bucketed[crime_type] * (total_felonies_last_month / 4) /
+                total_felonies_last_year,
+                np.nan
+            )
+    y_pred.index.name = 'index'
+    return y_pred.fillna(0)
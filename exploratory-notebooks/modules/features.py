@@ -0,0 +1,213 @@
+"""Feature encoding shared by the prediction models."""
+import numpy as np
+import scipy.sparse as sp
+import threading
+
+
+def get_day_hour_keys(X):
+    """Number each (day of week, hourgroup) pair from 0 to 41."""
+    return (
+        6 * np.asarray(X['COMPLAINT_DAYOFWEEK'], dtype=np.int64) +
+        np.asarray(X['COMPLAINT_HOURGROUP'], dtype=np.int64) // 4
+    )
+
+
+class FeatureEncoder(object):
+    """One-hot encode categorical columns into a sparse design matrix.
+
+    The categories of each column are learned once by fit(), so every
+    matrix from transform() has the same columns, whatever values happen
+    to be in the data being transformed. Values that weren't seen by
+    fit() get no indicator. The numeric columns come first, followed by
+    one indicator column per category, like pd.get_dummies.
+
+    Parameters
+    ----------
+    categorical : list
+        The names of the columns to one-hot encode
+    numeric : list, optional
+        The names of the columns to use as they are
+    derived : dict, optional
+        A dictionary of {name : function} for columns that aren't in the
+        data. Each function takes the DataFrame and returns an array.
+        'COMPLAINT_DAY_HOUR' is always available.
+    """
+
+    def __init__(self, categorical, numeric=None, derived=None):
+        self.categorical = list(categorical)
+        self.numeric = list(numeric) if numeric is not None else []
+        self.derived = {'COMPLAINT_DAY_HOUR': get_day_hour_keys}
+        if derived is not None:
+            self.derived.update(derived)
+        self.categories = None
+
+    @property
+    def key(self):
+        """A hashable description of the features this encoder makes."""
+        return (
+            tuple(self.categorical), tuple(self.numeric),
+            tuple(sorted(
+                (name, self.derived[name])
+                for name in self.categorical + self.numeric
+                if name in self.derived
+            ))
+        )
+
+    @property
+    def feature_names(self):
+        """The names of the columns of the encoded matrix."""
+        return self.numeric + [
+            '{0}_{1}'.format(col, value)
+            for col, values in zip(self.categorical, self.categories)
+            for value in values
+        ]
+
+    def _get_values(self, X, col):
+        if col in self.derived:
+            return np.asarray(self.derived[col](X))
+        return np.asarray(X[col])
+
+    def fit(self, X):
+        """Learn the categories of each categorical column of X."""
+        self.categories = [
+            np.unique(self._get_values(X, col)) for col in self.categorical
+        ]
+        return self
+
+    def transform(self, X):
+        """Encode X as a CSR matrix with one row per row of X."""
+        n_rows = len(X)
+        n_numeric = len(self.numeric)
+        n_slots = n_numeric + len(self.categorical)
+        data = np.zeros((n_rows, n_slots), dtype=np.float64)
+        indices = np.zeros((n_rows, n_slots), dtype=np.int32)
+        for i, col in enumerate(self.numeric):
+            data[:, i] = self._get_values(X, col)
+            indices[:, i] = i
+        offset = n_numeric
+        for i, (col, values) in enumerate(
+            zip(self.categorical, self.categories)
+        ):
+            col_values = self._get_values(X, col)
+            codes = np.searchsorted(values, col_values)
+            codes = np.minimum(codes, max(len(values) - 1, 0))
+            found = (
+                values[codes] == col_values if len(values) > 0
+                else np.zeros(n_rows, dtype=bool)
+            )
+            # Unseen values keep a zero at the start of their block, which
+            # eliminate_zeros() drops, so the columns stay sorted.
+            data[:, n_numeric + i] = found
+            indices[:, n_numeric + i] = offset + np.where(found, codes, 0)
+            offset += len(values)
+        features = sp.csr_matrix(
+            (
+                data.ravel(), indices.ravel(),
+                np.arange(0, n_rows * n_slots + 1, n_slots)
+            ),
+            shape=(n_rows, offset)
+        )
+        features.eliminate_zeros()
+        return features
+
+    def partial_fit(self, X):
+        """Add the categories in X to the ones already learned.
+
+        This lets the categories be learned from data that's too big to
+        load at once, one chunk at a time.
+        """
+        categories = [
+            np.unique(self._get_values(X, col)) for col in self.categorical
+        ]
+        if self.categories is not None:
+            categories = [
+                np.union1d(old, new)
+                for old, new in zip(self.categories, categories)
+            ]
+        self.categories = categories
+        return self
+
+    def fit_transform(self, X):
+        return self.fit(X).transform(X)
+
+
+class FeatureCache(object):
+    """Encoded features for one X_train and X_test, shared by models.
+
+    Pass the same cache to several models run on the same data, and the
+    matrices for each kind of features are only made once, by the first
+    model that asks for them. The matrices are kept in the cache and
+    nowhere else. The cache doesn't notice changes to X_train or X_test,
+    so make a new one after editing them. It can be used from several
+    threads.
+
+    Parameters
+    ----------
+    X_train, X_test : DataFrames
+    """
+
+    def __init__(self, X_train, X_test):
+        self.X_train = X_train
+        self.X_test = X_test
+        self._encoded = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def encode(self, encoder):
+        """Return the result of encode_split for an encoder.
+
+        Encoders with the same key share one result, which has the
+        encoder that was fitted first.
+        """
+        with self._lock:
+            key_lock = self._locks.setdefault(encoder.key, threading.Lock())
+        # Other encoders can be fitted while this one is.
+        with key_lock:
+            if encoder.key not in self._encoded:
+                self._encoded[encoder.key] = encode_split(
+                    encoder, self.X_train, self.X_test
+                )
+            return self._encoded[encoder.key]
+
+
+def encode_split(encoder, X_train, X_test, cache=None):
+    """Fit an encoder on X_train, then encode X_train and X_test.
+
+    Parameters
+    ----------
+    encoder : FeatureEncoder
+    X_train, X_test : DataFrames
+    cache : FeatureCache, optional
+        A cache made for these X_train and X_test. If given, the result
+        is taken from the cache, so that it's only made once.
+
+    Returns
+    -------
+    encoder : FeatureEncoder
+        The fitted encoder (one fitted earlier if it came from the cache)
+    X_train_features, X_test_features : CSR matrices
+    """
+    if cache is not None:
+        if cache.X_train is not X_train or cache.X_test is not X_test:
+            raise ValueError('The cache was made for different data')
+        return cache.encode(encoder)
+    encoder.fit(X_train)
+    return encoder, encoder.transform(X_train), encoder.transform(X_test)
+
+
+def encode_categorical_features(X_train, X_test, cache=None):
+    """Encode the features used by the sample models.
+
+    The features are temperature, precipIntensity and indicators for
+    each precinct, month, and (day of week, hourgroup) pair. See
+    encode_split for the cache parameter.
+    """
+    return encode_split(
+        FeatureEncoder(
+            categorical=[
+                'ADDR_PCT_CD', 'COMPLAINT_MONTH', 'COMPLAINT_DAY_HOUR'
+            ],
+            numeric=['temperature', 'precipIntensity']
+        ),
+        X_train, X_test, cache
+    )
@@ -2,12 +2,12 @@
 Use Gradient Boosting Regression
 """
 import numpy as np
-import pandas as pd
 import datetime
 import csv
 from sklearn.ensemble import GradientBoostingRegressor
 from sklearn.model_selection import cross_val_score
 from skopt import gp_minimize
+from .features import encode_categorical_features
 class GBR(object):
     
     def __init__(self, X_train, y_train,  cv=5):
@@ -41,23 +41,10 @@ class GBR(object):
 
 def gbr_model_bo(X_train, y_train, X_test):
     """Example model to perform gradient Boosted Regression on each felony type alongwith hyperparameter tuning."""
-    def add_categorical_features(X):
-        X_features = X[[
-            'ADDR_PCT_CD',
-            'COMPLAINT_MONTH',
-            'temperature',
-            'precipIntensity'
-        ]].copy()
-        X_features['COMPLAINT_DAY_HOUR'] = \
-            X['COMPLAINT_DAYOFWEEK'].astype(str) + '_' + \
-            X['COMPLAINT_HOURGROUP'].astype(str)
-        return pd.get_dummies(
-            X_features,
-            columns=['ADDR_PCT_CD', 'COMPLAINT_MONTH', 'COMPLAINT_DAY_HOUR']
-        )
     np.random.seed(324)
-    X_train_features = add_categorical_features(X_train)
-    X_test_features = add_categorical_features(X_test)
+    _, X_train_features, X_test_features = encode_categorical_features(
+        X_train, X_test
+    )
     y_pred = X_test[[
         'COMPLAINT_YEAR',
         'COMPLAINT_MONTH',
@@ -87,25 +74,12 @@ def gbr_model_bo(X_train, y_train, X_test):
     return store
 
 
-def gbr_model(X_train, y_train, X_test, params):
+def gbr_model(X_train, y_train, X_test, params, cache=None):
     """Example model to perform gradient Boosted Regression on each felony type alongwith hyperparameter tuning."""
-    def add_categorical_features(X):
-        X_features = X[[
-            'ADDR_PCT_CD',
-            'COMPLAINT_MONTH',
-            'temperature',
-            'precipIntensity'
-        ]].copy()
-        X_features['COMPLAINT_DAY_HOUR'] = \
-            X['COMPLAINT_DAYOFWEEK'].astype(str) + '_' + \
-            X['COMPLAINT_HOURGROUP'].astype(str)
-        return pd.get_dummies(
-            X_features,
-            columns=['ADDR_PCT_CD', 'COMPLAINT_MONTH', 'COMPLAINT_DAY_HOUR']
-        )
     np.random.seed(324)
-    X_train_features = add_categorical_features(X_train)
-    X_test_features = add_categorical_features(X_test)
+    _, X_train_features, X_test_features = encode_categorical_features(
+        X_train, X_test, cache
+    )
     y_pred = X_test[[
         'COMPLAINT_YEAR',
         'COMPLAINT_MONTH',
@@ -1,13 +1,132 @@
 """Functions for processing the core dataset."""
 import numpy as np
 import pandas as pd
-import datetime
 import csv
+import io
+import os
+from multiprocessing import Pool
 from time import localtime, strftime
-from collections import defaultdict
+from .count_cube import (
+    build_count_cube, update_count_cube, save_count_cube, load_count_cube,
+    save_complaint_ids, load_complaint_ids
+)
+
+# The categories we'll be trying to predict, in order.
+_OFFENSE_CATEGORIES = [
+    'Homicide', 'Rape', 'Robbery', 'FelonyAssault',
+    'Burglary', 'GrandLarceny', 'GrandLarcenyAuto',
+    'Fraud', 'Forgery', 'Arson', 'Drugs',
+    'Weapons', 'CriminalMischief', 'Other'
+]
+
+# Our mapping of NYPD codes (KY_CD) to categories. Anything that isn't
+# listed here is 'Other'.
+_OFFENSE_CODES = {
+    101: 'Homicide',
+    102: 'Homicide',
+    103: 'Homicide',
+
+    104: 'Rape',
+    116: 'Rape',
+
+    105: 'Robbery',             # Mugging
+    106: 'FelonyAssault',
+    107: 'Burglary',            # Breaking and entering
+    109: 'GrandLarceny',
+    110: 'GrandLarcenyAuto',
+
+    112: 'Fraud',
+    113: 'Forgery',
+    114: 'Arson',
+    117: 'Drugs',
+    118: 'Weapons',
+    121: 'CriminalMischief',    # Graffiti
+}
+
+# Smaller dtypes used when loading the clean data with compact=True.
+_COMPACT_DTYPES = {
+    'KY_CD': np.int16,
+    'OFNS_DESC': 'category',
+    'BORO_NM': 'category',
+    'ADDR_PCT_CD': np.int16,
+    'Latitude': np.float32,
+    'Longitude': np.float32,
+}
+
+
+def get_byte_ranges(filepath, n_ranges):
+    """Split the rows of a CSV file into line-aligned byte ranges.
+
+    The header line isn't included in any of the ranges. This assumes
+    that no quoted field contains a newline, which holds for the NYPD
+    files.
 
+    Parameters
+    ----------
+    filepath : string
+    n_ranges : integer
+        The number of ranges to aim for. There may be fewer if the file
+        has fewer lines.
+
+    Returns
+    -------
+    byte_ranges : list of (start, end) tuples
+    """
+    size = os.path.getsize(filepath)
+    with open(filepath, 'rb') as f:
+        f.readline()
+        boundaries = [f.tell()]
+        for i in range(1, n_ranges):
+            approx = boundaries[0] + (size - boundaries[0]) * i // n_ranges
+            if approx <= boundaries[-1]:
+                continue
+            # Move to the start of the line following this position.
+            f.seek(approx - 1)
+            f.readline()
+            if boundaries[-1] < f.tell() < size:
+                boundaries.append(f.tell())
+    boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def open_byte_range(filepath, byte_range):
+    """Return a file-like object with the header and one range of rows."""
+    start, end = byte_range
+    with open(filepath, 'rb') as f:
+        header = f.readline()
+        f.seek(start)
+        rows = f.read(end - start)
+    return io.BytesIO(header + rows)
+
+
+def map_byte_ranges(func, filepath, n_jobs, range_bytes=2**26):
+    """Apply a function to ranges of a CSV file in a pool of processes.
 
-def read_orig_file(data_path=None, orig_file=None):
+    Parameters
+    ----------
+    func : function
+        A top-level function that takes a (start, end) byte range
+    filepath : string
+    n_jobs : integer
+        The number of worker processes
+    range_bytes : integer, optional
+        The approximate size of each range. There are always at least
+        n_jobs ranges.
+
+    Returns
+    -------
+    results : iterator
+        The results of func for each range, in file order
+    """
+    n_ranges = max(n_jobs, os.path.getsize(filepath) // range_bytes + 1)
+    byte_ranges = get_byte_ranges(filepath, n_ranges)
+    with Pool(n_jobs) as pool:
+        for result in pool.imap(func, byte_ranges):
+            yield result
+
+
+def read_orig_file(data_path=None, orig_file=None, chunksize=None,
+                   byte_range=None):
     """Read the original data file into a pandas DataFrame.
 
     Parameters
@@ -16,10 +135,15 @@ def read_orig_file(data_path=None, orig_file=None):
         directory containing original file
     orig_file : string, optional
         filename containing original file
+    chunksize : integer, optional
+        If given, read the file lazily in chunks of this many rows
+    byte_range : tuple, optional
+        If given, only read the rows in this (start, end) byte range,
+        as returned by get_byte_ranges
 
     Returns
     -------
-    raw_data : DataFrame
+    raw_data : DataFrame, or an iterator of DataFrames if chunksize is given
 
     """
     orig_file_defaults = {
@@ -52,7 +176,6 @@ def read_orig_file(data_path=None, orig_file=None):
             'Latitude',
             'Longitude'
         ],
-        'parse_dates_cols': ['RPT_DT'],
     }
 
     if data_path is None:
@@ -60,17 +183,44 @@ def read_orig_file(data_path=None, orig_file=None):
     if orig_file is None:
         orig_file = orig_file_defaults['orig_file']
 
+    filepath = data_path + orig_file
+    if byte_range is not None:
+        filepath = open_byte_range(filepath, byte_range)
     raw_data = pd.read_csv(
-        filepath_or_buffer=data_path + orig_file,
+        filepath_or_buffer=filepath,
         index_col=orig_file_defaults['index_col'],
         usecols=orig_file_defaults['usecols'],
         dtype=orig_file_defaults['dtype'],
-        parse_dates=orig_file_defaults['parse_dates_cols'],
-        infer_datetime_format=True,
+        chunksize=chunksize,
     )
+    if chunksize is not None:
+        return (parse_report_dates(chunk) for chunk in raw_data)
+    return parse_report_dates(raw_data)
+
+
+def parse_report_dates(raw_data):
+    """Convert the RPT_DT column of the original data to datetimes.
+
+    RPT_DT is always 'MM/DD/YYYY'; rows that don't parse become NaT.
+    """
+    report_dates, _ = parse_fixed_datetimes(raw_data['RPT_DT'])
+    raw_data['RPT_DT'] = report_dates.view('<M8[ns]')
     return raw_data
 
 
+def filter_felonies(raw_data):
+    """Keep only felonies that have a numeric precinct code.
+
+    This works on any slice of the original file, so it can be applied
+    to one chunk at a time.
+    """
+    raw_data = raw_data[raw_data['LAW_CAT_CD'] == 'FELONY']
+    return raw_data[pd.to_numeric(
+        raw_data['ADDR_PCT_CD'],
+        errors='coerce'
+    ).fillna(-1) != -1]
+
+
 def filter_raw_data(raw_data, output_file=None):
     """Get rid of useless rows.
 
@@ -91,19 +241,98 @@ def filter_raw_data(raw_data, output_file=None):
     raw_data.dropna(
         subset=['CMPLNT_FR_DT', 'CMPLNT_FR_TM']
     )
-    raw_data = raw_data[raw_data['LAW_CAT_CD'] == 'FELONY']
-    raw_data = raw_data[pd.to_numeric(
-        raw_data['ADDR_PCT_CD'],
-        errors='coerce'
-    ).fillna(-1) != -1]
+    raw_data = filter_felonies(raw_data)
     raw_data.to_csv(output_file)
 
 
-def save_dated_felonies(output_file=None):
-    """Read the original file, filter it, and save the result."""
+def stream_filter_raw_data(raw_chunks, output_file=None):
+    """Filter the original data one chunk at a time.
+
+    Each filtered chunk is appended to the output as soon as it is
+    produced, so only one chunk is ever held in memory.
+
+    Parameters
+    ----------
+    raw_chunks : iterable of DataFrames
+        e.g. the iterator returned by read_orig_file(chunksize=...)
+    output_file : string
+
+    Returns
+    -------
+    n_rows : integer
+        The number of rows written
+    """
+    if output_file is None:
+        output_file = '../precrime_data/raw_dated_felonies.csv'
+
+    return append_to_csv(
+        (filter_felonies(chunk) for chunk in raw_chunks),
+        output_file
+    )
+
+
+def append_to_csv(frames, output_file):
+    """Write DataFrames to one CSV file, one after another.
+
+    Returns the total number of rows written.
+    """
+    n_rows = 0
+    for i, frame in enumerate(frames):
+        frame.to_csv(
+            output_file,
+            mode='w' if i == 0 else 'a',
+            header=(i == 0)
+        )
+        n_rows += len(frame)
+    return n_rows
+
+
+def _filter_orig_byte_range(byte_range):
+    """Read and filter one range of the original file."""
+    return filter_felonies(read_orig_file(byte_range=byte_range))
+
+
+def save_dated_felonies(output_file=None, chunksize=None, n_jobs=None):
+    """Read the original file, filter it, and save the result.
+
+    Parameters
+    ----------
+    output_file : string, optional
+    chunksize : integer, optional
+        If given, stream the original file in chunks of this many rows
+        instead of loading it all at once. The output is the same, but
+        peak memory depends only on the chunk size.
+    n_jobs : integer, optional
+        If given, read and filter ranges of the original file in this
+        many processes. The output is the same as the serial version.
+    """
+    if output_file is None:
+        output_file = '../precrime_data/raw_dated_felonies.csv'
     print('Starting ({0})...'.format(
         strftime("%Y-%m-%d %H:%M:%S", localtime())
     ))
+    if n_jobs is not None:
+        n_rows = append_to_csv(
+            map_byte_ranges(
+                _filter_orig_byte_range,
+                '../precrime_data/NYPD_Complaint_Data_Historic.csv',
+                n_jobs
+            ),
+            output_file
+        )
+        print('Saved {0} rows ({1})'.format(
+            n_rows, strftime("%Y-%m-%d %H:%M:%S", localtime())
+        ))
+        return
+    if chunksize is not None:
+        n_rows = stream_filter_raw_data(
+            read_orig_file(chunksize=chunksize),
+            output_file
+        )
+        print('Saved {0} rows ({1})'.format(
+            n_rows, strftime("%Y-%m-%d %H:%M:%S", localtime())
+        ))
+        return
     raw_data = read_orig_file()
     print('Saving filtered output ({0})...'.format(
         strftime("%Y-%m-%d %H:%M:%S", localtime())
@@ -112,8 +341,97 @@ def save_dated_felonies(output_file=None):
     print('Done ({0})'.format(strftime("%Y-%m-%d %H:%M:%S", localtime())))
 
 
-def load_dated_felonies(data_path=None, filtered_file=None):
-    """Load in the file that has been filtered for valid dates."""
+def _parse_fixed_digits(chars, positions):
+    """Read the decimal number stored in the given byte columns."""
+    digits = chars[:, positions].astype(np.int64) - ord('0')
+    valid = ((digits >= 0) & (digits <= 9)).all(axis=1)
+    place_values = 10 ** np.arange(len(positions) - 1, -1, -1)
+    return digits.dot(place_values), valid
+
+
+def parse_fixed_datetimes(dates, times=None):
+    """Parse fixed-format date and time strings without any inference.
+
+    The whole column is checked and converted with a handful of array
+    operations, instead of parsing each row on its own.
+
+    Parameters
+    ----------
+    dates : array-like of strings
+        Dates in the format 'MM/DD/YYYY', e.g. CMPLNT_FR_DT or RPT_DT
+    times : array-like of strings, optional
+        Times in the format 'HH:MM:SS', e.g. CMPLNT_FR_TM
+
+    Returns
+    -------
+    datetimes : ndarray of int64
+        Nanoseconds since the epoch. Rows that don't parse hold the
+        integer value of NaT, so datetimes.view('<M8[ns]') gives the
+        timestamps directly.
+    valid : ndarray of bool
+        False for every row that was missing, malformed, or outside the
+        range of a nanosecond timestamp
+    """
+    def as_bytes(strings, width):
+        # One extra byte so that strings that are too long don't match.
+        # Non-ASCII characters become '?', which fails the checks below.
+        fixed = pd.Series(strings).fillna('').astype(str).str.encode(
+            'ascii', 'replace'
+        ).to_numpy(dtype=object).astype('S{0}'.format(width + 1))
+        chars = fixed.view(np.uint8).reshape(len(fixed), width + 1)
+        return chars, chars[:, width] == 0
+
+    chars, valid = as_bytes(dates, 10)
+    month, ok = _parse_fixed_digits(chars, [0, 1])
+    valid &= ok
+    day, ok = _parse_fixed_digits(chars, [3, 4])
+    valid &= ok
+    year, ok = _parse_fixed_digits(chars, [6, 7, 8, 9])
+    valid &= ok
+    valid &= (chars[:, 2] == ord('/')) & (chars[:, 5] == ord('/'))
+    valid &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31)
+    # Stay within the range that datetime64[ns] can represent.
+    valid &= (year >= 1678) & (year <= 2261)
+
+    # Use a harmless placeholder for invalid rows while doing arithmetic.
+    year = np.where(valid, year, 1970)
+    month = np.where(valid, month, 1)
+    day = np.where(valid, day, 1)
+    np_dates = (
+        np.array(year - 1970, dtype='<M8[Y]') +
+        np.array(month - 1, dtype='<m8[M]') +
+        np.array(day - 1, dtype='<m8[D]')
+    )
+    # Dates like 02/30 roll over into the next month; reject those.
+    valid &= np_dates.astype('<M8[M]') == (
+        np.array(year - 1970, dtype='<M8[Y]') +
+        np.array(month - 1, dtype='<m8[M]')
+    )
+    datetimes = np_dates.astype('<M8[ns]').astype(np.int64)
+
+    if times is not None:
+        chars, ok = as_bytes(times, 8)
+        valid &= ok
+        hour, ok = _parse_fixed_digits(chars, [0, 1])
+        valid &= ok
+        minute, ok = _parse_fixed_digits(chars, [3, 4])
+        valid &= ok
+        second, ok = _parse_fixed_digits(chars, [6, 7])
+        valid &= ok
+        valid &= (chars[:, 2] == ord(':')) & (chars[:, 5] == ord(':'))
+        valid &= (hour <= 23) & (minute <= 59) & (second <= 59)
+        datetimes += ((hour * 60 + minute) * 60 + second) * 10**9
+
+    datetimes[~valid] = np.datetime64('NaT').astype(np.int64)
+    return datetimes, valid
+
+
+def load_dated_felonies(data_path=None, filtered_file=None, byte_range=None):
+    """Load in the file that has been filtered for valid dates.
+
+    If byte_range is given, only the rows in that (start, end) range of
+    the file are loaded; see get_byte_ranges.
+    """
     filtered_file_defaults = {
         'data_path': '../precrime_data/',
         'filtered_file': 'raw_dated_felonies.csv',
@@ -142,10 +460,6 @@ def load_dated_felonies(data_path=None, filtered_file=None):
             'Latitude',
             'Longitude',
         ],
-        'parse_dates_dict': {
-            'COMPLAINT_DATETIME': ['CMPLNT_FR_DT', 'CMPLNT_FR_TM'],
-            'REPORT_DATE': ['RPT_DT'],
-        },
     }
 
     if data_path is None:
@@ -153,37 +467,129 @@ def load_dated_felonies(data_path=None, filtered_file=None):
     if filtered_file is None:
         filtered_file = filtered_file_defaults['filtered_file']
 
-    nypd_data = pd.read_csv(
-        filepath_or_buffer=data_path + filtered_file,
+    filepath = data_path + filtered_file
+    if byte_range is not None:
+        filepath = open_byte_range(filepath, byte_range)
+    raw_data = pd.read_csv(
+        filepath_or_buffer=filepath,
         index_col=filtered_file_defaults['index_col'],
         usecols=filtered_file_defaults['usecols'],
         dtype=filtered_file_defaults['dtype'],
-        parse_dates=filtered_file_defaults['parse_dates_dict'],
-        infer_datetime_format=True,
     )
-    nypd_data['COMPLAINT_DATETIME'] = pd.to_datetime(
-        nypd_data['COMPLAINT_DATETIME'],
-        errors='coerce'
+    complaint_datetimes, valid = parse_fixed_datetimes(
+        raw_data['CMPLNT_FR_DT'],
+        raw_data['CMPLNT_FR_TM']
+    )
+    if not valid.all():
+        print('{0} rows have malformed complaint times'.format(
+            np.count_nonzero(~valid)
+        ))
+    # read_orig_file has already converted RPT_DT, so it was saved as
+    # 'YYYY-MM-DD'.
+    report_dates = pd.to_datetime(
+        raw_data['RPT_DT'], format='%Y-%m-%d', errors='coerce'
+    )
+
+    nypd_data = raw_data.drop(
+        columns=['CMPLNT_FR_DT', 'CMPLNT_FR_TM', 'RPT_DT']
     )
-    nypd_data.dropna(subset=['COMPLAINT_DATETIME'])
+    nypd_data.insert(
+        0, 'COMPLAINT_DATETIME', complaint_datetimes.view('<M8[ns]')
+    )
+    nypd_data.insert(1, 'REPORT_DATE', report_dates)
     # Exclude weird data on 2006-01-01.
     return nypd_data[nypd_data['COMPLAINT_DATETIME'] >= '2006-01-02 00:00:00']
 
 
-def save_clean_felonies(output_file=None):
-    """Read the filtered file, do more filtering, and save the result."""
+def get_file_format(filename):
+    """Guess the storage format of a file from its extension.
+
+    Returns one of 'parquet', 'feather', 'cube', or 'csv'.
+    """
+    if filename.endswith('.cube'):
+        return 'cube'
+    if filename.endswith('.parquet'):
+        return 'parquet'
+    if filename.endswith('.feather'):
+        return 'feather'
+    return 'csv'
+
+
+def _load_dated_byte_range(byte_range):
+    """Load and clean one range of the filtered file."""
+    return load_dated_felonies(byte_range=byte_range)
+
+
+def save_clean_felonies(output_file=None, n_jobs=None):
+    """Read the filtered file, do more filtering, and save the result.
+
+    The data is sorted by complaint time before saving. If output_file
+    ends in '.parquet' or '.feather', it is written in that columnar
+    format (which requires pyarrow), keeping the dtypes and sort order
+    so that load_clean_felonies doesn't have to parse or sort anything.
+
+    If n_jobs is given, ranges of the filtered file are loaded and
+    cleaned in that many processes.
+    """
     if output_file is None:
         output_file = '../precrime_data/clean_felonies.csv'
     print('Starting ({0})...'.format(
         strftime("%Y-%m-%d %H:%M:%S", localtime())
     ))
-    filtered_felonies = load_dated_felonies()
+    if n_jobs is not None:
+        filtered_felonies = pd.concat(list(map_byte_ranges(
+            _load_dated_byte_range,
+            '../precrime_data/raw_dated_felonies.csv',
+            n_jobs
+        )))
+    else:
+        filtered_felonies = load_dated_felonies()
+    filtered_felonies = filtered_felonies.sort_values(
+        by='COMPLAINT_DATETIME', kind='mergesort'
+    )
     print('Done ({0})'.format(strftime("%Y-%m-%d %H:%M:%S", localtime())))
-    filtered_felonies.to_csv(output_file)
+    file_format = get_file_format(output_file)
+    if file_format == 'parquet':
+        filtered_felonies.to_parquet(output_file)
+    elif file_format == 'feather':
+        # Feather can't store an index, so keep it as a regular column.
+        filtered_felonies.reset_index().to_feather(output_file)
+    else:
+        filtered_felonies.to_csv(output_file)
+
+
+def make_compact(nypd_data):
+    """Convert the clean data to smaller dtypes, in place.
+
+    Strings become categoricals, codes become int16, and the GPS
+    coordinates become float32 (still accurate to about a meter).
+    """
+    for col, dtype in _COMPACT_DTYPES.items():
+        if col in nypd_data.columns:
+            nypd_data[col] = nypd_data[col].astype(dtype)
+
 
+def load_clean_felonies(data_path=None, clean_file=None, columns=None,
+                        compact=False):
+    """Load in the fully cleaned and filtered file.
 
-def load_clean_felonies(data_path=None, clean_file=None):
-    """Load in the fully cleaned and filtered file."""
+    Parameters
+    ----------
+    data_path : string, optional
+    clean_file : string, optional
+        A '.parquet' or '.feather' file written by save_clean_felonies is
+        read directly, with no parsing or sorting. Anything else is read
+        as CSV.
+    columns : list, optional
+        Only read these columns (the CMPLNT_NUM index is always included)
+    compact : boolean, optional, default False
+        If True, use the smaller dtypes from make_compact()
+
+    Returns
+    -------
+    nypd_data : DataFrame
+        Sorted by COMPLAINT_DATETIME
+    """
     clean_file_defaults = {
         'data_path': '../precrime_data/',
         'clean_file': 'clean_felonies.csv',
@@ -210,7 +616,10 @@ def load_clean_felonies(data_path=None, clean_file=None):
             'Latitude',
             'Longitude',
         ],
-        'parse_dates_cols': ['REPORT_DATE', 'COMPLAINT_DATETIME'],
+        'date_formats': {
+            'REPORT_DATE': '%Y-%m-%d',
+            'COMPLAINT_DATETIME': '%Y-%m-%d %H:%M:%S',
+        },
     }
 
     if data_path is None:
@@ -218,174 +627,312 @@ def load_clean_felonies(data_path=None, clean_file=None):
     if clean_file is None:
         clean_file = clean_file_defaults['clean_file']
 
+    file_format = get_file_format(clean_file)
+    if file_format == 'parquet':
+        nypd_data = pd.read_parquet(data_path + clean_file, columns=columns)
+        if compact:
+            make_compact(nypd_data)
+        return nypd_data
+    if file_format == 'feather':
+        if columns is not None:
+            columns = [clean_file_defaults['index_col']] + list(columns)
+        nypd_data = pd.read_feather(
+            data_path + clean_file,
+            columns=columns
+        ).set_index(clean_file_defaults['index_col'])
+        if compact:
+            make_compact(nypd_data)
+        return nypd_data
+
+    dtype = clean_file_defaults['dtype']
+    if compact:
+        dtype = dict(dtype, **_COMPACT_DTYPES)
+    usecols = clean_file_defaults['usecols']
+    if columns is not None:
+        usecols = [clean_file_defaults['index_col']] + list(columns)
     nypd_data = pd.read_csv(
         filepath_or_buffer=data_path+clean_file,
         index_col=clean_file_defaults['index_col'],
-        usecols=clean_file_defaults['usecols'],
-        dtype=clean_file_defaults['dtype'],
-        parse_dates=clean_file_defaults['parse_dates_cols'],
-        infer_datetime_format=True,
+        usecols=usecols,
+        dtype=dtype,
     )
-
-    nypd_data.sort_values(by='COMPLAINT_DATETIME', inplace=True)
+    for col, date_format in clean_file_defaults['date_formats'].items():
+        if col in nypd_data.columns:
+            nypd_data[col] = pd.to_datetime(
+                nypd_data[col], format=date_format, errors='coerce'
+            )
+
+    if 'COMPLAINT_DATETIME' in nypd_data.columns:
+        nypd_data.sort_values(by='COMPLAINT_DATETIME', inplace=True)
     return nypd_data
 
 
-def add_offense_category(df):
+def get_offense_categories():
+    """Return the list of offense categories, in order."""
+    return list(_OFFENSE_CATEGORIES)
+
+
+def make_offense_lookup(offense_codes=None, categories=None, default='Other'):
+    """Make an array for looking up category codes by KY_CD.
+
+    Parameters
+    ----------
+    offense_codes : dict, optional
+        A dictionary of {KY_CD : category name}. Defaults to our own
+        mapping of NYPD codes.
+    categories : list, optional
+        The category names, in order. Defaults to our own categories if
+        offense_codes isn't given, otherwise to the distinct values of
+        offense_codes in the order they appear.
+    default : string, optional
+        The category for any KY_CD not in offense_codes
+
+    Returns
+    -------
+    lookup : ndarray
+        lookup[ky_cd] is the index into categories for that KY_CD. The
+        last entry is the default category, for codes past the end.
+    categories : list
+    """
+    if offense_codes is None:
+        offense_codes = _OFFENSE_CODES
+        if categories is None:
+            categories = _OFFENSE_CATEGORIES
+    if categories is None:
+        categories = []
+        for name in offense_codes.values():
+            if name not in categories:
+                categories.append(name)
+    categories = list(categories)
+    if default not in categories:
+        categories.append(default)
+
+    category_codes = {name: i for i, name in enumerate(categories)}
+    lookup = np.full(
+        max(offense_codes.keys()) + 2,
+        category_codes[default],
+        dtype=np.int8
+    )
+    for ky_cd, name in offense_codes.items():
+        lookup[ky_cd] = category_codes[name]
+    return lookup, categories
+
+
+def add_offense_category(df, offense_codes=None, categories=None,
+                         default='Other'):
     """Add an 'OFFENSE' category to the dataframe.
 
-    This uses our own mapping of NYPD codes to categories we'll be
-    trying to predict.
+    By default this uses our own mapping of NYPD codes to categories
+    we'll be trying to predict. See make_offense_lookup for the
+    parameters used to supply a different mapping.
     """
-    offense_category = defaultdict(lambda: 'Other')
-
-    offense_category[101] = 'Homicide'
-    offense_category[102] = 'Homicide'
-    offense_category[103] = 'Homicide'
-
-    offense_category[104] = 'Rape'
-    offense_category[116] = 'Rape'
-
-    offense_category[105] = 'Robbery'           # Mugging
-    offense_category[106] = 'FelonyAssault'
-    offense_category[107] = 'Burglary'          # Breaking and entering
-    offense_category[109] = 'GrandLarceny'
-    offense_category[110] = 'GrandLarcenyAuto'
-
-    offense_category[112] = 'Fraud'
-    offense_category[113] = 'Forgery'
-    offense_category[114] = 'Arson'
-    offense_category[117] = 'Drugs'
-    offense_category[118] = 'Weapons'
-    offense_category[121] = 'CriminalMischief'  # Graffiti
-
-    df['OFFENSE'] = df['KY_CD'].map(offense_category).astype('category')
-    df['OFFENSE'].cat.set_categories([
-        'Homicide', 'Rape', 'Robbery', 'FelonyAssault',
-        'Burglary', 'GrandLarceny', 'GrandLarcenyAuto',
-        'Fraud', 'Forgery', 'Arson', 'Drugs',
-        'Weapons', 'CriminalMischief', 'Other'
-    ], inplace=True)
-
-
-def add_datetime_columns(nypd_data):
-    """Add datetime columns to the data."""
-    nypd_data['COMPLAINT_YEAR'] = nypd_data['COMPLAINT_DATETIME'].dt.year
-    nypd_data['COMPLAINT_MONTH'] = nypd_data['COMPLAINT_DATETIME'].dt.month
-    nypd_data['COMPLAINT_DAY'] = nypd_data['COMPLAINT_DATETIME'].dt.day
-    nypd_data['COMPLAINT_HOUR'] = nypd_data['COMPLAINT_DATETIME'].dt.hour
-    nypd_data['COMPLAINT_DAYOFWEEK'] = \
-        nypd_data['COMPLAINT_DATETIME'].dt.dayofweek
-    nypd_data['COMPLAINT_HOURGROUP'] = nypd_data['COMPLAINT_HOUR'].map(
-        lambda x: 4 * (int(x) // 4)
+    lookup, categories = make_offense_lookup(
+        offense_codes, categories, default
     )
-    nypd_data['COMPLAINT_ID'] = nypd_data.index.values
+    codes = lookup[np.clip(df['KY_CD'].values, 0, len(lookup) - 1)]
+    df['OFFENSE'] = pd.Categorical.from_codes(codes, categories)
+
+
+def add_datetime_columns(nypd_data, compact=False):
+    """Add datetime columns to the data.
+
+    If compact is True, the calendar fields use int8/int16 and the
+    COMPLAINT_ID column (a copy of the index) is left out.
+    """
+    complaint_datetimes = nypd_data['COMPLAINT_DATETIME'].dt
+    nypd_data['COMPLAINT_YEAR'] = complaint_datetimes.year
+    nypd_data['COMPLAINT_MONTH'] = complaint_datetimes.month
+    nypd_data['COMPLAINT_DAY'] = complaint_datetimes.day
+    nypd_data['COMPLAINT_HOUR'] = complaint_datetimes.hour
+    nypd_data['COMPLAINT_DAYOFWEEK'] = complaint_datetimes.dayofweek
+    nypd_data['COMPLAINT_HOURGROUP'] = 4 * (nypd_data['COMPLAINT_HOUR'] // 4)
+    if compact:
+        nypd_data['COMPLAINT_YEAR'] = \
+            nypd_data['COMPLAINT_YEAR'].astype(np.int16)
+        for col in ['COMPLAINT_MONTH', 'COMPLAINT_DAY', 'COMPLAINT_HOUR',
+                    'COMPLAINT_DAYOFWEEK', 'COMPLAINT_HOURGROUP']:
+            nypd_data[col] = nypd_data[col].astype(np.int8)
+    else:
+        nypd_data['COMPLAINT_ID'] = nypd_data.index.values
 
 
 def pivot_felonies(nypd_data):
-    """Pivot the data and aggregate it in a useful way."""
-    # First we pivot the data to sum up offenses by category.
-    pivoted = nypd_data.pivot_table(
-        index=[
-            nypd_data['COMPLAINT_YEAR'],
-            nypd_data['COMPLAINT_MONTH'],
-            nypd_data['COMPLAINT_DAY'],
-            nypd_data['COMPLAINT_HOURGROUP'],
-            'ADDR_PCT_CD',   # These are not duplicated across boros.
-        ],
-        values='KY_CD',
-        columns='OFFENSE',
-        fill_value=0,
-        aggfunc=len
-    )
-    # Unfortunately, the resulting pivot table has rows for dates that don't
-    # actually exist since it uses the cross product of years and months,
-    # resulting in rows for nonexistent dates like February 30th.
-    #
-    # To fix this, we create an empty dataframe with the correct values in the
-    # index, and then merge the two dataframes.
-    first_time = nypd_data['COMPLAINT_DATETIME'].min()
-    first_date = datetime.date(
-        first_time.year,
-        first_time.month,
-        first_time.day
-    )
-    last_time = nypd_data['COMPLAINT_DATETIME'].max()
-    last_date = datetime.date(
-        last_time.year,
-        last_time.month,
-        last_time.day
-    )
-    one_day = datetime.timedelta(days=1)
-    dates_in_dataset = []
-    d = first_date
-    while d <= last_date:
-        dates_in_dataset.append(d)
-        d += one_day
-    hourgroups = nypd_data['COMPLAINT_HOURGROUP'].unique()
-    precinct_codes = nypd_data['ADDR_PCT_CD'].unique()
-    # The cross-product of days, hourgroups, and precincts is what we want.
-    # We make an empty dataframe with the correct index,
-    # get the year/month/day back out, and then reset the index.
-    empty_df = pd.DataFrame(index=pd.MultiIndex.from_product(
-        [sorted(dates_in_dataset), sorted(hourgroups), sorted(precinct_codes)],
-        names=[u'date', u'COMPLAINT_HOURGROUP', u'ADDR_PCT_CD']
-    ))
-    empty_df['COMPLAINT_YEAR'] = empty_df.index.get_level_values(0).year
-    empty_df['COMPLAINT_MONTH'] = empty_df.index.get_level_values(0).month
-    empty_df['COMPLAINT_DAY'] = empty_df.index.get_level_values(0).day
-    empty_df['COMPLAINT_HOURGROUP'] = empty_df.index.get_level_values(1)
-    empty_df['ADDR_PCT_CD'] = empty_df.index.get_level_values(2)
-    empty_df['COMPLAINT_DAYOFWEEK'] = \
-        empty_df.index.get_level_values(0).dayofweek
-    empty_df.set_index([
-            'COMPLAINT_YEAR', 'COMPLAINT_MONTH', 'COMPLAINT_DAY',
-            'COMPLAINT_HOURGROUP', 'ADDR_PCT_CD'
-        ],
-        inplace=True
-    )
-    correct_pivots = empty_df.merge(
-        pivoted,
-        how='left', left_index=True, right_index=True
-    )
-    # Finally, add in the complaint IDs so we can cross reference vs
-    # the original table if desired.
-    correct_pivots['COMPLAINT_IDS'] = nypd_data.groupby([
-        'COMPLAINT_YEAR', 'COMPLAINT_MONTH', 'COMPLAINT_DAY',
-        'COMPLAINT_HOURGROUP', 'ADDR_PCT_CD']
-    )['COMPLAINT_ID'].agg(lambda x: ' '.join([str(i) for i in x]))
-    correct_pivots['COMPLAINT_IDS'] = \
-        correct_pivots['COMPLAINT_IDS'].fillna(value='')
-    return correct_pivots
-
-
-def save_pivoted_felonies(nypd_data, data_path=None, pivot_file=None):
-    """Pivot the data and write the pivot table out to disk."""
+    """Pivot the data and aggregate it in a useful way.
+
+    There is one row for every (day, hourgroup, precinct), including
+    the ones with no complaints at all, which have counts of zero. To
+    cross reference the rows against the original table, use the
+    complaint_ids of build_count_cube(nypd_data); its cells are in the
+    same order as these rows.
+    """
+    return build_count_cube(nypd_data).to_frame()
+
+
+def save_pivoted_felonies(nypd_data, data_path=None, pivot_file=None,
+                          ids_file=None):
+    """Pivot the data and write the pivot table out to disk.
+
+    By default this is saved as a count cube file, which
+    load_pivoted_felonies memory-maps instead of parsing; if pivot_file
+    ends in '.csv' it is saved as CSV instead. Either way, the complaint
+    ids for each row are saved separately to ids_file; see
+    load_pivoted_complaint_ids.
+    """
     pivot_file_defaults = {
         'data_path': '../precrime_data/',
-        'pivot_file': 'pivoted_felonies.csv',
+        'pivot_file': 'pivoted_felonies.cube',
+        'ids_file': 'pivoted_felonies_ids.npz',
     }
     if data_path is None:
         data_path = pivot_file_defaults['data_path']
     if pivot_file is None:
         pivot_file = pivot_file_defaults['pivot_file']
-    pivoted = pivot_felonies(nypd_data)
-    pivoted.to_csv(data_path + pivot_file, quoting=csv.QUOTE_NONNUMERIC)
+    if ids_file is None:
+        ids_file = pivot_file_defaults['ids_file']
+    cube = build_count_cube(nypd_data)
+    if get_file_format(pivot_file) == 'cube':
+        save_count_cube(cube, data_path + pivot_file, data_path + ids_file)
+    else:
+        cube.to_frame().to_csv(
+            data_path + pivot_file, quoting=csv.QUOTE_NONNUMERIC
+        )
+        save_complaint_ids(cube.complaint_ids, data_path + ids_file)
+
+
+def update_pivoted_felonies(new_data, data_path=None, pivot_file=None,
+                            ids_file=None):
+    """Add newly cleaned complaints to the saved count cube.
+
+    The cube file is updated in place: new days are appended to the
+    end of the file, and only the cells that the new complaints fall
+    into are rewritten. Late reports, for days already in the cube, are
+    added to the days they happened on.
+
+    The counts are flushed to the cube file before the ids file is
+    written, so if this is interrupted in between, the counts include
+    the new complaints but the ids don't. Either way, running it again
+    with the same complaints counts them twice; rebuild the files with
+    save_pivoted_felonies instead.
 
+    Parameters
+    ----------
+    new_data : DataFrame
+        Complaints that aren't in the cube yet, with the columns added by
+        add_offense_category and add_datetime_columns
+    data_path : string, optional
+    pivot_file : string, optional
+        A count cube file written by save_pivoted_felonies
+    ids_file : string, optional
+    """
+    pivot_file_defaults = {
+        'data_path': '../precrime_data/',
+        'pivot_file': 'pivoted_felonies.cube',
+        'ids_file': 'pivoted_felonies_ids.npz',
+    }
+    if data_path is None:
+        data_path = pivot_file_defaults['data_path']
+    if pivot_file is None:
+        pivot_file = pivot_file_defaults['pivot_file']
+    if ids_file is None:
+        ids_file = pivot_file_defaults['ids_file']
+    cube = load_count_cube(
+        data_path + pivot_file, mode='r+', ids_filepath=data_path + ids_file
+    )
+    cube, first_changed_day = update_count_cube(cube, new_data)
+    print('Updated {0} days starting {1} ({2})'.format(
+        len(cube.days) - first_changed_day,
+        cube.days[first_changed_day],
+        strftime("%Y-%m-%d %H:%M:%S", localtime())
+    ))
+    if isinstance(cube.counts, np.memmap):
+        cube.counts.flush()
+        save_complaint_ids(cube.complaint_ids, data_path + ids_file)
+    else:
+        # New hourgroups or precincts, so the whole file has to change.
+        save_count_cube(cube, data_path + pivot_file, data_path + ids_file)
+
+
+def load_pivoted_felonies(data_path=None, pivot_file=None,
+                          first_date=None, last_date=None, offenses=None):
+    """Load the saved, pivoted data.
+
+    Parameters
+    ----------
+    data_path : string, optional
+    pivot_file : string, optional
+        A count cube file is memory-mapped, so only the days that are
+        asked for are read. Anything else is read as CSV. Defaults to
+        pivoted_felonies.cube, or to pivoted_felonies.csv if there is no
+        cube file but there is one of those.
+    first_date, last_date : dates, optional
+        Only load the days in [first_date, last_date)
+    offenses : list, optional
+        Only load the counts for these offenses
 
-def load_pivoted_felonies(data_path=None, pivot_file=None):
-    """Load the saved, pivoted data."""
+    Returns
+    -------
+    pivoted : DataFrame
+        In the format returned by pivot_felonies
+    """
     pivot_file_defaults = {
         'data_path': '../precrime_data/',
-        'pivot_file': 'pivoted_felonies.csv',
+        'pivot_file': 'pivoted_felonies.cube',
+        'csv_pivot_file': 'pivoted_felonies.csv',
     }
     if data_path is None:
         data_path = pivot_file_defaults['data_path']
     if pivot_file is None:
         pivot_file = pivot_file_defaults['pivot_file']
+        # Data directories from before the count cube only have the CSV.
+        csv_pivot_file = pivot_file_defaults['csv_pivot_file']
+        if (not os.path.exists(data_path + pivot_file) and
+                os.path.exists(data_path + csv_pivot_file)):
+            pivot_file = csv_pivot_file
+    if get_file_format(pivot_file) == 'cube':
+        cube = load_count_cube(data_path + pivot_file, with_ids=False)
+        return cube.slice_days(first_date, last_date).to_frame(offenses)
     pivoted = pd.read_csv(
         data_path + pivot_file,
         index_col=[0, 1, 2, 3, 4]
     )
-    pivoted['COMPLAINT_IDS'] = pivoted['COMPLAINT_IDS'].fillna(value='')
+    # Older files carried the complaint ids as a column of strings.
+    if 'COMPLAINT_IDS' in pivoted.columns:
+        pivoted.drop(columns='COMPLAINT_IDS', inplace=True)
+    if offenses is not None:
+        pivoted = pivoted[[
+            col for col in pivoted.columns
+            if col == 'COMPLAINT_DAYOFWEEK' or col in offenses
+        ]]
+    if first_date is not None or last_date is not None:
+        dates = pd.to_datetime(pd.DataFrame({
+            'year': pivoted.index.get_level_values(0),
+            'month': pivoted.index.get_level_values(1),
+            'day': pivoted.index.get_level_values(2),
+        }))
+        in_range = np.ones(len(pivoted), dtype=bool)
+        if first_date is not None:
+            in_range &= (dates >= pd.Timestamp(first_date)).values
+        if last_date is not None:
+            in_range &= (dates < pd.Timestamp(last_date)).values
+        pivoted = pivoted[in_range]
     return pivoted
+
+
+def load_pivoted_complaint_ids(data_path=None, ids_file=None):
+    """Load the complaint ids saved by save_pivoted_felonies.
+
+    Returns
+    -------
+    complaint_ids : ComplaintIds
+        complaint_ids[i] is an array of the ids in row i of the
+        pivoted data
+    """
+    ids_file_defaults = {
+        'data_path': '../precrime_data/',
+        'ids_file': 'pivoted_felonies_ids.npz',
+    }
+    if data_path is None:
+        data_path = ids_file_defaults['data_path']
+    if ids_file is None:
+        ids_file = ids_file_defaults['ids_file']
+    return load_complaint_ids(data_path + ids_file)
@@ -0,0 +1,147 @@
+"""Time series models that are updated one day at a time."""
+import numpy as np
+from .count_cube import CountCube
+
+
+# The longest window either model looks back over. It's a whole number of
+# weeks, so a day and the day _HISTORY_DAYS before it share a weekday.
+_HISTORY_DAYS = 7 * 52
+
+
+class OnlineTimeSeriesForecaster(object):
+    """Forecast the next day's counts from a running history.
+
+    This gives the same forecasts as the batch time series models, for
+    data where every (day, hourgroup, precinct) cell is present, without
+    recomputing anything over the whole history. The last 52 weeks of
+    daily counts are kept in a ring buffer, along with running totals
+    for each weekday and for the whole window, and update() adjusts them
+    by adding the new day and dropping the days that fall out of each
+    window. update() and forecast() take time proportional to the size
+    of one day's counts, however long the history is.
+
+    Parameters
+    ----------
+    first_date : date
+        The date of the first day that will be passed to update()
+    hourgroups : array-like of integers
+    precincts : array-like of integers
+    offenses : list of strings
+        The axes of each day's counts, as in a CountCube
+    model : string, optional, default 'fancy'
+        'fancy' for the model of fancy_time_series_model, or 'simple' for
+        the model of simple_time_series_model
+    """
+
+    def __init__(self, first_date, hourgroups, precincts, offenses,
+                 model='fancy'):
+        if model not in ('fancy', 'simple'):
+            raise ValueError('Unknown model: {0}'.format(model))
+        self.model = model
+        self.next_day = np.datetime64(first_date, 'D')
+        self.hourgroups = np.asarray(hourgroups)
+        self.precincts = np.asarray(precincts)
+        self.offenses = list(offenses)
+        day_shape = (
+            len(self.hourgroups), len(self.precincts), len(self.offenses)
+        )
+        self.history = np.zeros((_HISTORY_DAYS,) + day_shape, dtype=np.int64)
+        self.daily_totals = np.zeros(_HISTORY_DAYS, dtype=np.int64)
+        # Sums over the last 52 and last 5 days with each weekday.
+        self.weekday_year_sums = np.zeros((7,) + day_shape, dtype=np.int64)
+        self.weekday_5_week_sums = np.zeros(
+            (7,) + day_shape, dtype=np.int64
+        )
+        self.weekday_days_seen = np.zeros(7, dtype=np.int64)
+        self.total_last_year = 0
+        self.total_last_month = 0
+
+    @classmethod
+    def from_count_cube(cls, cube, last_date=None, model='fancy'):
+        """Make a forecaster and update it with the days in a cube.
+
+        Parameters
+        ----------
+        cube : CountCube
+        last_date : date, optional
+            Only use the days before this date, so that the first
+            forecast is for last_date
+        model : string, optional, default 'fancy'
+        """
+        cube = cube.slice_days(last_date=last_date)
+        forecaster = cls(
+            cube.days[0], cube.hourgroups, cube.precincts, cube.offenses,
+            model
+        )
+        for day_counts in cube.counts:
+            forecaster.update(day_counts)
+        return forecaster
+
+    def update(self, day_counts, date=None):
+        """Add the counts for the next day.
+
+        Parameters
+        ----------
+        day_counts : array-like of shape (hourgroups, precincts, offenses)
+            Like one day of a CountCube's counts
+        date : date, optional
+            If given, check that day_counts is for the expected day
+        """
+        if date is not None and np.datetime64(date, 'D') != self.next_day:
+            raise ValueError('Expected counts for {0}, got {1}'.format(
+                self.next_day, np.datetime64(date, 'D')
+            ))
+        day_counts = np.asarray(day_counts, dtype=np.int64)
+        day_number = self.next_day.astype(np.int64)
+        slot = day_number % _HISTORY_DAYS
+        weekday = day_number % 7
+        day_total = day_counts.sum()
+
+        # The days that drop out of the 5-week and 4-week windows. The day
+        # that drops out of the 52-week window is the one being replaced.
+        five_weeks_ago = (day_number - 7 * 5) % _HISTORY_DAYS
+        four_weeks_ago = (day_number - 7 * 4) % _HISTORY_DAYS
+        self.weekday_5_week_sums[weekday] += (
+            day_counts - self.history[five_weeks_ago]
+        )
+        self.weekday_year_sums[weekday] += day_counts - self.history[slot]
+        self.total_last_month += day_total - self.daily_totals[four_weeks_ago]
+        self.total_last_year += day_total - self.daily_totals[slot]
+        self.weekday_days_seen[weekday] += 1
+
+        self.history[slot] = day_counts
+        self.daily_totals[slot] = day_total
+        self.next_day += 1
+
+    def forecast(self):
+        """Forecast the counts for the next day.
+
+        Returns
+        -------
+        forecast : ndarray of shape (hourgroups, precincts, offenses)
+        """
+        weekday = self.next_day.astype(np.int64) % 7
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if self.model == 'fancy':
+                forecast = (
+                    self.weekday_year_sums[weekday] *
+                    (self.total_last_month / 4) /
+                    self.total_last_year
+                )
+            else:
+                forecast = (
+                    self.weekday_5_week_sums[weekday] /
+                    min(self.weekday_days_seen[weekday], 5)
+                )
+        return np.nan_to_num(forecast, nan=0.)
+
+    def forecast_cube(self):
+        """Return the forecast as a one-day CountCube.
+
+        Its to_frame() has the same rows and columns as the batch models'
+        predictions for the day.
+        """
+        return CountCube(
+            np.array([self.next_day]), self.hourgroups, self.precincts,
+            self.offenses, self.forecast()[np.newaxis]
+        )
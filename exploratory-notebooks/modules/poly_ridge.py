@@ -1,58 +1,62 @@
 """Functions to make crime predictions."""
 import numpy as np
 import pandas as pd
-from sklearn.linear_model import Ridge
-
-
-def poly_ridge_model(X_train, y_train, X_test):
-    """Ridge regression with categorical features."""
-    def get_decimal_date(X):
-        y = np.array(X['COMPLAINT_YEAR']-1970, dtype='<M8[Y]')
-        m = np.array(X['COMPLAINT_MONTH']-1, dtype='<m8[M]')
-        d = np.array(X['COMPLAINT_DAY']-1, dtype='<m8[D]')
-        mid_dates = y+m+d
-        m2 = np.zeros_like(y, dtype='<m8[M]')
-        d2 = np.zeros_like(y, dtype='<m8[D]')
-        start_dates = y+m2+d2
-        y3 = y + 1
-        end_dates = y3+m2+d2
-        decimal_date = pd.Series(
-            X['COMPLAINT_YEAR'].values + (
-                (mid_dates - start_dates) / (end_dates - start_dates)
-            ),
-            index=X.index
-        )
-        year_frac = pd.Series(
-            (mid_dates - start_dates) / (end_dates - start_dates),
-            index=X.index
-        )
-        return decimal_date, year_frac
-
-    def add_categorical_features_and_dates(X):
-        X_features = X[[
-            'ADDR_PCT_CD',
-            'temperature',
-            'precipIntensity'
-        ]].copy()
-        X_features['COMPLAINT_DAY_HOUR'] = \
-            X['COMPLAINT_DAYOFWEEK'].astype(str) + '_' + \
-            X['COMPLAINT_HOURGROUP'].astype(str)
-        decimal_date, year_frac = get_decimal_date(X)
-        X_features['DECIMAL_DATE'] = decimal_date
-        X_features['YEAR_FRAC'] = year_frac
-        # X_features['temp_sq'] = X_features['temperature'] ** 2
-        # X_features['precip_sq'] = X_features['precipIntensity'] ** 2
-        X_features['date_sq'] = X_features['DECIMAL_DATE'] ** 2
-        X_features['yf_sq'] = X_features['YEAR_FRAC'] ** 2
-        # X_features['date_cube'] = X_features['DECIMAL_DATE'] ** 3
-        # X_features['yf_cube'] = X_features['YEAR_FRAC'] ** 3
-        return pd.get_dummies(
-            X_features,
-            columns=['ADDR_PCT_CD', 'COMPLAINT_DAY_HOUR']
-        )
-
-    X_train_features = add_categorical_features_and_dates(X_train)
-    X_test_features = add_categorical_features_and_dates(X_test)
+from .features import FeatureEncoder, encode_split
+from .ridge import StreamingRidge
+from .calendar_dim import get_year_fractions
+
+
+def get_decimal_date(X):
+    """Return each row's date as a decimal year and a fraction of a year."""
+    decimal_date, year_frac = get_year_fractions(
+        X['COMPLAINT_YEAR'], X['COMPLAINT_MONTH'], X['COMPLAINT_DAY']
+    )
+    return (
+        pd.Series(decimal_date, index=X.index),
+        pd.Series(year_frac, index=X.index)
+    )
+
+
+def get_decimal_dates(X):
+    return get_decimal_date(X)[0]
+
+
+def get_year_fracs(X):
+    return get_decimal_date(X)[1]
+
+
+def get_decimal_dates_sq(X):
+    return get_decimal_date(X)[0] ** 2
+
+
+def get_year_fracs_sq(X):
+    return get_decimal_date(X)[1] ** 2
+
+
+def poly_ridge_model(X_train, y_train, X_test, alpha=1.0, cache=None):
+    """Ridge regression with categorical features.
+
+    If a FeatureCache for X_train and X_test is given, the features are
+    taken from it.
+    """
+    # Squares of temperature, precipIntensity and cubes of the dates
+    # were also tried.
+    encoder = FeatureEncoder(
+        categorical=['ADDR_PCT_CD', 'COMPLAINT_DAY_HOUR'],
+        numeric=[
+            'temperature', 'precipIntensity',
+            'DECIMAL_DATE', 'YEAR_FRAC', 'date_sq', 'yf_sq'
+        ],
+        derived={
+            'DECIMAL_DATE': get_decimal_dates,
+            'YEAR_FRAC': get_year_fracs,
+            'date_sq': get_decimal_dates_sq,
+            'yf_sq': get_year_fracs_sq,
+        }
+    )
+    _, X_train_features, X_test_features = encode_split(
+        encoder, X_train, X_test, cache
+    )
     y_pred = X_test[[
         'COMPLAINT_YEAR',
         'COMPLAINT_MONTH',
@@ -62,7 +66,7 @@ def poly_ridge_model(X_train, y_train, X_test):
     ]].copy()
 
     y_train_dvs = y_train.select_dtypes(exclude=['object'])
-    ridge = Ridge()
+    ridge = StreamingRidge(alpha)
     ridge.fit(X_train_features, y_train_dvs)
     y_pred_dvs = ridge.predict(X_test_features)
 
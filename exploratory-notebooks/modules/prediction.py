@@ -4,65 +4,294 @@ import pandas as pd
 import datetime
 import csv
 from .weather import load_weather_data
-from .nypd_data import load_pivoted_felonies
+from .nypd_data import load_pivoted_felonies, get_offense_categories
+from .calendar_dim import get_slot_ids
 from .nyc_shapefiles import load_census_info
-from sklearn.linear_model import Ridge
-
-
-def load_all_data():
-    """Load all the data, merge it, and return a single dataframe."""
-    weather_hist = load_weather_data()
-    pivoted_felonies = load_pivoted_felonies()
-    precinct_df, tract_df, intersection_df = load_census_info()
-
-    merged_data = pivoted_felonies.reset_index().merge(
-        weather_hist,
-        how='left',
-        left_on=['COMPLAINT_YEAR', 'COMPLAINT_MONTH',
-                 'COMPLAINT_DAY', 'COMPLAINT_HOURGROUP'],
-        right_on=['WEATHER_YEAR', 'WEATHER_MONTH',
-                  'WEATHER_DAY', 'WEATHER_HOURGROUP'],
-    ).merge(
-        precinct_df,
-        how='left',
-        left_on='ADDR_PCT_CD',
-        right_on='Precinct'
-    )[[
-        'COMPLAINT_YEAR', 'COMPLAINT_MONTH', 'COMPLAINT_DAY',
-        'COMPLAINT_HOURGROUP', 'ADDR_PCT_CD', 'COMPLAINT_DAYOFWEEK',
-        'apparentTemperature', 'cloudCover', 'dewPoint', 'humidity', 'icon',
-        'nearestStormBearing', 'nearestStormDistance', 'ozone',
-        'precipIntensity', 'precipProbability', 'precipType', 'pressure',
-        'summary', 'temperature', 'time', 'uvIndex', 'visibility',
-        'windBearing', 'windGust', 'windSpeed',
-        'PrecinctShapefileID', 'Population', 'Median_Household_Income',
-        'Percent_Bachelors_Degree',
-        'Homicide', 'Rape', 'Robbery', 'FelonyAssault', 'Burglary',
-        'GrandLarceny', 'GrandLarcenyAuto', 'Fraud', 'Forgery', 'Arson',
-        'Drugs', 'Weapons', 'CriminalMischief', 'Other', 'COMPLAINT_IDS',
-    ]]
-    return merged_data
+from .features import encode_categorical_features
+from .ridge import StreamingRidge
+
+
+_CALENDAR_COLUMNS = [
+    'COMPLAINT_YEAR', 'COMPLAINT_MONTH', 'COMPLAINT_DAY',
+    'COMPLAINT_HOURGROUP', 'ADDR_PCT_CD', 'COMPLAINT_DAYOFWEEK',
+]
+
+_WEATHER_COLUMNS = [
+    'apparentTemperature', 'cloudCover', 'dewPoint', 'humidity', 'icon',
+    'nearestStormBearing', 'nearestStormDistance', 'ozone',
+    'precipIntensity', 'precipProbability', 'precipType', 'pressure',
+    'summary', 'temperature', 'time', 'uvIndex', 'visibility',
+    'windBearing', 'windGust', 'windSpeed',
+]
+
+_CENSUS_COLUMNS = [
+    'PrecinctShapefileID', 'Population', 'Median_Household_Income',
+    'Percent_Bachelors_Degree',
+]
+
+# The offense categories of the pivoted data, which are what's predicted.
+_CRIME_TYPES = get_offense_categories()
+
+
+def make_row_lookup(keys):
+    """Make an array for finding the row that has each integer key.
+
+    Returns the lookup array and the smallest key. If a key appears more
+    than once, the first row with that key is used.
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    unique_keys, first_rows = np.unique(keys, return_index=True)
+    offset = unique_keys[0]
+    lookup = np.full(unique_keys[-1] - offset + 1, -1, dtype=np.int64)
+    lookup[unique_keys - offset] = first_rows
+    return lookup, offset
+
+
+def find_rows(lookup, offset, keys):
+    """Look up the row for each key, or -1 for keys that aren't there."""
+    positions = np.asarray(keys, dtype=np.int64) - offset
+    found = (positions >= 0) & (positions < len(lookup))
+    rows = np.full(len(positions), -1, dtype=np.int64)
+    rows[found] = lookup[positions[found]]
+    return rows
+
+
+def gather_columns(table, columns, rows):
+    """Take the given rows of each column, with NaN where rows is -1.
+
+    Returns a dictionary of {column : ndarray}.
+    """
+    missing = rows < 0
+    safe_rows = np.where(missing, 0, rows)
+    gathered = {}
+    for col in columns:
+        values = table[col].to_numpy().take(safe_rows)
+        if missing.any():
+            if values.dtype.kind in 'biu':
+                values = values.astype(np.float64)
+            values[missing] = np.nan
+        gathered[col] = values
+    return gathered
+
+
+class CrimeDataset(object):
+    """The merged crime, weather and census data, loaded on demand.
+
+    Nothing is read when the dataset is created. load() reads, joins and
+    returns only the columns and days that are asked for.
+
+    Parameters
+    ----------
+    data_path : string, optional
+        The directory containing the pivoted felonies, weather, and
+        census files
+    pivot_file : string, optional
+        The pivoted felonies file in data_path, a count cube or a CSV
+        file. See load_pivoted_felonies for the default.
+    """
+
+    def __init__(self, data_path='../precrime_data/', pivot_file=None):
+        self.data_path = data_path
+        self.pivot_file = pivot_file
+
+    @property
+    def columns(self):
+        """All the columns that load() can return."""
+        return (_CALENDAR_COLUMNS + _WEATHER_COLUMNS +
+                _CENSUS_COLUMNS + _CRIME_TYPES)
+
+    def load(self, columns=None, first_date=None, last_date=None):
+        """Load the merged data.
+
+        Weather and census attributes are attached by computing an
+        integer key for each row (a time slot id, or a precinct code)
+        and indexing straight into the weather and precinct tables.
+
+        Parameters
+        ----------
+        columns : list, optional
+            The columns to load. The calendar and precinct columns are
+            always included. Defaults to all of them.
+        first_date, last_date : dates, optional
+            Only load the days in [first_date, last_date)
+
+        Returns
+        -------
+        merged_data : DataFrame
+        """
+        if columns is None:
+            columns = self.columns
+        unknown = set(columns) - set(self.columns)
+        if unknown:
+            raise ValueError('Unknown columns: {0}'.format(sorted(unknown)))
+        weather_columns = [c for c in _WEATHER_COLUMNS if c in columns]
+        census_columns = [c for c in _CENSUS_COLUMNS if c in columns]
+        crime_types = [c for c in _CRIME_TYPES if c in columns]
+
+        pivoted_felonies = load_pivoted_felonies(
+            data_path=self.data_path,
+            pivot_file=self.pivot_file,
+            first_date=first_date,
+            last_date=last_date,
+            offenses=crime_types
+        ).reset_index()
+
+        merged_data = {
+            col: pivoted_felonies[col].to_numpy()
+            for col in _CALENDAR_COLUMNS
+        }
+        if weather_columns:
+            weather_hist = load_weather_data(
+                self.data_path + 'weather_hist.csv',
+                columns=weather_columns
+            )
+            weather_lookup, weather_offset = make_row_lookup(get_slot_ids(
+                weather_hist['WEATHER_YEAR'], weather_hist['WEATHER_MONTH'],
+                weather_hist['WEATHER_DAY'], weather_hist['WEATHER_HOURGROUP']
+            ))
+            weather_rows = find_rows(
+                weather_lookup, weather_offset, get_slot_ids(
+                    pivoted_felonies['COMPLAINT_YEAR'],
+                    pivoted_felonies['COMPLAINT_MONTH'],
+                    pivoted_felonies['COMPLAINT_DAY'],
+                    pivoted_felonies['COMPLAINT_HOURGROUP']
+                )
+            )
+            merged_data.update(
+                gather_columns(weather_hist, weather_columns, weather_rows)
+            )
+        if census_columns:
+            precinct_df, tract_df, intersection_df = load_census_info(
+                self.data_path
+            )
+            precinct_lookup, precinct_offset = make_row_lookup(
+                precinct_df['Precinct']
+            )
+            precinct_rows = find_rows(
+                precinct_lookup, precinct_offset,
+                pivoted_felonies['ADDR_PCT_CD']
+            )
+            merged_data.update(
+                gather_columns(precinct_df, census_columns, precinct_rows)
+            )
+        for col in crime_types:
+            merged_data[col] = pivoted_felonies[col].to_numpy()
+        return pd.DataFrame(merged_data)
+
+    def iter_chunks(self, first_date, last_date, months=12, columns=None):
+        """Load the merged data a few months at a time.
+
+        Parameters
+        ----------
+        first_date, last_date : dates
+            Cover the days in [first_date, last_date)
+        months : integer, optional, default 12
+            Start a new chunk every this many calendar months
+        columns : list, optional
+            The columns to load, as in load()
+
+        Yields
+        ------
+        merged_data : DataFrame
+            The merged data for each chunk, in date order
+        """
+        first_day = np.datetime64(first_date, 'D')
+        last_day = np.datetime64(last_date, 'D')
+        boundaries = np.arange(
+            first_day.astype('<M8[M]') + months,
+            last_day.astype('<M8[M]') + 1,
+            months
+        ).astype('<M8[D]')
+        boundaries = np.concatenate([
+            [first_day], boundaries[boundaries < last_day], [last_day]
+        ])
+        for chunk_first, chunk_last in zip(boundaries[:-1], boundaries[1:]):
+            yield self.load(columns, chunk_first, chunk_last)
+
+
+def load_all_data(columns=None, first_date=None, last_date=None,
+                  lazy=False, pivot_file=None):
+    """Load all the data, merge it, and return a single dataframe.
+
+    Parameters
+    ----------
+    columns : list, optional
+        Only load these columns (plus the calendar and precinct columns)
+    first_date, last_date : dates, optional
+        Only load the days in [first_date, last_date)
+    lazy : boolean, optional, default False
+        If True, return a CrimeDataset without loading anything, so that
+        callers can load() just what they need later.
+    pivot_file : string, optional
+        The pivoted felonies file to load, as in CrimeDataset
+
+    Returns
+    -------
+    merged_data : DataFrame, or CrimeDataset if lazy is True
+    """
+    dataset = CrimeDataset(pivot_file=pivot_file)
+    if lazy:
+        return dataset
+    return dataset.load(columns, first_date, last_date)
+
+
+def get_X_y_columns(merged_data):
+    """Return the X (feature) and y (data) columns of the merged data."""
+    X_columns = [
+        col for col in
+        _CALENDAR_COLUMNS + _WEATHER_COLUMNS + _CENSUS_COLUMNS
+        if col in merged_data.columns
+    ]
+    y_columns = [col for col in _CRIME_TYPES if col in merged_data.columns]
+    return X_columns, y_columns
 
 
 def split_into_X_y(merged_data):
     """Split the merged data into the X (features) and y (data) portions."""
-    X = merged_data[[
-        'COMPLAINT_YEAR', 'COMPLAINT_MONTH', 'COMPLAINT_DAY',
-        'COMPLAINT_HOURGROUP', 'ADDR_PCT_CD', 'COMPLAINT_DAYOFWEEK',
-        'apparentTemperature', 'cloudCover', 'dewPoint', 'humidity', 'icon',
-        'nearestStormBearing', 'nearestStormDistance', 'ozone',
-        'precipIntensity', 'precipProbability', 'precipType', 'pressure',
-        'summary', 'temperature', 'time', 'uvIndex', 'visibility',
-        'windBearing', 'windGust', 'windSpeed',
-        'PrecinctShapefileID', 'Population', 'Median_Household_Income',
-        'Percent_Bachelors_Degree'
-    ]]
-    y = merged_data[[
-        'Homicide', 'Rape', 'Robbery', 'FelonyAssault', 'Burglary',
-        'GrandLarceny', 'GrandLarcenyAuto', 'Fraud', 'Forgery', 'Arson',
-        'Drugs', 'Weapons', 'CriminalMischief', 'Other', 'COMPLAINT_IDS',
-    ]]
-    return X, y
+    X_columns, y_columns = get_X_y_columns(merged_data)
+    return merged_data[X_columns], merged_data[y_columns]
+
+
+def get_split_indices(merged_data, test_times):
+    """Find which rows of the dataset are in the test set.
+
+    Each row's date and hourgroup is turned into an integer time slot id,
+    and membership in the test set is checked with a bitmap of the test
+    slots.
+
+    Parameters
+    ----------
+    merged_data : DataFrame
+        A DataFrame with columns 'COMPLAINT_YEAR', 'COMPLAINT_MONTH',
+        'COMPLAINT_DAY', and 'COMPLAINT_HOURGROUP'
+
+    test_times : DataFrame
+        A DataFrame with columns 'TEST_YEAR', 'TEST_MONTH',
+        'TEST_DAY', and 'TEST_HOURGROUP'
+
+    Returns
+    -------
+    train_idx, test_idx : ndarrays
+        The positions of the training and test rows in merged_data
+    """
+    data_slots = get_slot_ids(
+        merged_data['COMPLAINT_YEAR'], merged_data['COMPLAINT_MONTH'],
+        merged_data['COMPLAINT_DAY'], merged_data['COMPLAINT_HOURGROUP']
+    )
+    test_slots = get_slot_ids(
+        test_times['TEST_YEAR'], test_times['TEST_MONTH'],
+        test_times['TEST_DAY'], test_times['TEST_HOURGROUP']
+    )
+    if len(data_slots) == 0:
+        return np.arange(0), np.arange(0)
+    offset = data_slots.min()
+    is_test_slot = np.zeros(data_slots.max() - offset + 1, dtype=bool)
+    test_slots = test_slots - offset
+    is_test_slot[test_slots[
+        (test_slots >= 0) & (test_slots < len(is_test_slot))
+    ]] = True
+    test_mask = is_test_slot[data_slots - offset]
+    return np.flatnonzero(~test_mask), np.flatnonzero(test_mask)
 
 
 def split_by_datetime(merged_data, test_times):
@@ -78,22 +307,73 @@ def split_by_datetime(merged_data, test_times):
         A DataFrame with columns 'TEST_YEAR', 'TEST_MONTH',
         'TEST_DAY', and 'TEST_HOURGROUP'
     """
-    data_datecols = merged_data[['COMPLAINT_YEAR', 'COMPLAINT_MONTH',
-                                 'COMPLAINT_DAY', 'COMPLAINT_HOURGROUP']]
-    data_datecols.columns = ['year', 'month', 'day', 'hour']
-    data_datetimes = pd.to_datetime(data_datecols)
+    train_idx, test_idx = get_split_indices(merged_data, test_times)
+    return merged_data.iloc[train_idx], merged_data.iloc[test_idx]
+
+
+class PrecrimeSplit(object):
+    """A train/test split that shares the merged data instead of copying it.
+
+    Only the row positions of the training and test sets are stored.
+    X_train, X_test, y_train and y_test are taken from the merged data
+    when they're accessed and aren't kept, so any number of splits of
+    the same data cost one copy of the data plus their index arrays.
+
+    Every access makes a new copy of the rows, not a view. Changes made
+    to it are not seen by the split, so split.X_test['x'] = ... is lost
+    the next time split.X_test is accessed. Change merged_data to change
+    every split of it, or unpack the split once and work on the copies.
+    Unpacking once also avoids copying the rows again on each access.
+
+    A split can be unpacked like the result of precrime_train_test_split:
+
+        X_train, X_test, y_train, y_test = split
+
+    Parameters
+    ----------
+    merged_data : DataFrame
+    train_idx, test_idx : ndarrays
+        Row positions in merged_data, as returned by get_split_indices
+    """
+
+    _parts = ('X_train', 'X_test', 'y_train', 'y_test')
+
+    def __init__(self, merged_data, train_idx, test_idx):
+        self.merged_data = merged_data
+        self.train_idx = train_idx
+        self.test_idx = test_idx
+        self.X_columns, self.y_columns = get_X_y_columns(merged_data)
+
+    def _take(self, rows, columns):
+        return self.merged_data.iloc[
+            rows, self.merged_data.columns.get_indexer(columns)
+        ]
 
-    test_datecols = test_times[['TEST_YEAR', 'TEST_MONTH',
-                                'TEST_DAY', 'TEST_HOURGROUP']]
-    test_datecols.columns = ['year', 'month', 'day', 'hour']
-    test_datetimes = pd.to_datetime(test_datecols)
+    @property
+    def X_train(self):
+        return self._take(self.train_idx, self.X_columns)
 
-    test_mask = data_datetimes.isin(test_datetimes)
+    @property
+    def X_test(self):
+        return self._take(self.test_idx, self.X_columns)
 
-    train_data = merged_data[~test_mask]
-    test_data = merged_data[test_mask]
+    @property
+    def y_train(self):
+        return self._take(self.train_idx, self.y_columns)
 
-    return train_data, test_data
+    @property
+    def y_test(self):
+        return self._take(self.test_idx, self.y_columns)
+
+    def __len__(self):
+        return len(self._parts)
+
+    def __getitem__(self, i):
+        return getattr(self, self._parts[i])
+
+    def __iter__(self):
+        for part in self._parts:
+            yield getattr(self, part)
 
 
 def precrime_train_test_split(merged_data, test_times):
@@ -115,27 +395,85 @@ def precrime_train_test_split(merged_data, test_times):
     return X_train, X_test, y_train, y_test
 
 
+def get_period_slots(first_dates, last_dates):
+    """Return the time slot ids in one or more periods.
+
+    Parameters
+    ----------
+    first_dates, last_dates : dates, or array-likes of dates
+        Each period covers the days in [first_date, last_date)
+
+    Returns
+    -------
+    slot_ids : ndarray of int64
+        Every four-hour slot in each period, in order, with the periods
+        one after another
+    """
+    first_days = np.atleast_1d(
+        np.asarray(first_dates, dtype='<M8[D]')
+    ).astype(np.int64)
+    last_days = np.atleast_1d(
+        np.asarray(last_dates, dtype='<M8[D]')
+    ).astype(np.int64)
+    n_days = np.maximum(last_days - first_days, 0)
+    # Position i of the output is day (first_day + i - period_start).
+    period_starts = np.cumsum(n_days) - n_days
+    days = (
+        np.repeat(first_days - period_starts, n_days) +
+        np.arange(n_days.sum())
+    )
+    return (6 * days[:, np.newaxis] + np.arange(6)).ravel()
+
+
+def slots_to_test_times(slot_ids):
+    """Convert time slot ids into a test mask for use with split_by_datetime.
+
+    Returns
+    -------
+    test_times : DataFrame
+        A DataFrame with columns 'TEST_YEAR', 'TEST_MONTH',
+        'TEST_DAY', and 'TEST_HOURGROUP'
+    """
+    days = (slot_ids // 6).astype('<M8[D]')
+    years = days.astype('<M8[Y]')
+    months = days.astype('<M8[M]')
+    test_times = pd.DataFrame({
+        'TEST_YEAR': years.astype(np.int64) + 1970,
+        'TEST_MONTH': (
+            months.astype(np.int64) - 12 * years.astype(np.int64) + 1
+        ),
+        'TEST_DAY': (days - months).astype(np.int64) + 1,
+        'TEST_HOURGROUP': 4 * (slot_ids % 6),
+    })
+    test_times.index.rename('Index', inplace=True)
+    return test_times
+
+
 def create_test_period(first_date, last_date):
     """Create a DataFrame covering a specific period of time."""
-    one_day = datetime.timedelta(days=1)
-    dates_in_dataset = []
-    d = first_date
-    while d < last_date:
-        dates_in_dataset.append(d)
-        d += one_day
-    hourgroups = range(0, 24, 4)
-    test_times = pd.DataFrame(index=pd.MultiIndex.from_product(
-        [sorted(dates_in_dataset), sorted(hourgroups)],
-    ))
-    test_times['TEST_YEAR'] = test_times.index.get_level_values(0).year
-    test_times['TEST_MONTH'] = test_times.index.get_level_values(0).month
-    test_times['TEST_DAY'] = test_times.index.get_level_values(0).day
-    test_times['TEST_HOURGROUP'] = test_times.index.get_level_values(1)
-    test_times.reset_index(inplace=True)
-    test_times.index.rename('Index', inplace=True)
-    return test_times[[
-        'TEST_YEAR', 'TEST_MONTH', 'TEST_DAY', 'TEST_HOURGROUP'
-    ]]
+    return slots_to_test_times(get_period_slots(first_date, last_date))
+
+
+def get_quarter_dates(years, quarters):
+    """Return the first and last dates of some quarters.
+
+    Parameters
+    ----------
+    years : integer or array-like of integers
+    quarters : integer or array-like of integers from 1 to 4
+
+    Returns
+    -------
+    first_dates, last_dates : ndarrays of datetime64[D]
+        Each quarter covers the days in [first_date, last_date)
+    """
+    first_months = (
+        12 * (np.asarray(years, dtype=np.int64) - 1970) +
+        3 * (np.asarray(quarters, dtype=np.int64) - 1)
+    )
+    first_dates = first_months.astype('<M8[M]').astype('<M8[D]')
+    last_dates = (first_months + 3).astype('<M8[M]').astype('<M8[D]')
+    return first_dates, last_dates
 
 
 def create_test_quarter(year, quarter):
@@ -152,12 +490,7 @@ def create_test_quarter(year, quarter):
         A DataFrame with columns 'TEST_YEAR', 'TEST_MONTH',
         'TEST_DAY', and 'TEST_HOURGROUP'
     """
-    first_date = datetime.date(year, 3 * (quarter-1) + 1, 1)
-    if quarter == 4:
-        last_date = datetime.date(year+1, 1, 1)
-    else:
-        last_date = datetime.date(year, 3 * quarter + 1, 1)
-    return create_test_period(first_date, last_date)
+    return create_test_period(*get_quarter_dates(year, quarter))
 
 
 def create_finegrained_split(frac=0.1, random_state=4800):
@@ -178,17 +511,9 @@ def create_coarsegrained_split(n=5, random_state=4800):
     if random_state is not None:
         np.random.seed(random_state)
     test_quarters = np.random.choice(len(quarters), size=n, replace=False)
-    test_times = create_test_quarter(
-        quarters[test_quarters[0], 0], quarters[test_quarters[0], 1]
-    )
-    for i in range(1, n):
-        test_times = test_times.append(
-            create_test_quarter(
-                quarters[test_quarters[i], 0], quarters[test_quarters[i], 1]
-            ),
-            ignore_index=True
-        )
-    return test_times
+    return slots_to_test_times(get_period_slots(*get_quarter_dates(
+        quarters[test_quarters, 0], quarters[test_quarters, 1]
+    )))
 
 
 def create_2016_split():
@@ -237,32 +562,30 @@ def create_all_splits(crime_data, splits):
     splits : dict
         A dictionary of {split_name : DataFrame}, in the format returned by
         load_splits().
+
+    Returns
+    -------
+    train_test_data : dict
+        A dictionary of {split_name : PrecrimeSplit}. Each split can be
+        unpacked into X_train, X_test, y_train, y_test. These are new
+        copies of the rows of crime_data each time, so edits to them
+        aren't kept by the split; see PrecrimeSplit.
     """
     return {
-        k: precrime_train_test_split(crime_data, v)
+        k: PrecrimeSplit(crime_data, *get_split_indices(crime_data, v))
         for k, v in splits.items()
     }
 
 
-def sample_model(X_train, y_train, X_test):
-    """Example model to perform ridge regression on each felony type."""
-    def add_categorical_features(X):
-        X_features = X[[
-            'ADDR_PCT_CD',
-            'COMPLAINT_MONTH',
-            'temperature',
-            'precipIntensity'
-        ]].copy()
-        X_features['COMPLAINT_DAY_HOUR'] = \
-            X['COMPLAINT_DAYOFWEEK'].astype(str) + '_' + \
-            X['COMPLAINT_HOURGROUP'].astype(str)
-        return pd.get_dummies(
-            X_features,
-            columns=['ADDR_PCT_CD', 'COMPLAINT_MONTH', 'COMPLAINT_DAY_HOUR']
-        )
+def sample_model(X_train, y_train, X_test, alpha=1.0, cache=None):
+    """Example model to perform ridge regression on each felony type.
 
-    X_train_features = add_categorical_features(X_train)
-    X_test_features = add_categorical_features(X_test)
+    If a FeatureCache for X_train and X_test is given, the features are
+    taken from it.
+    """
+    _, X_train_features, X_test_features = encode_categorical_features(
+        X_train, X_test, cache
+    )
     y_pred = X_test[[
         'COMPLAINT_YEAR',
         'COMPLAINT_MONTH',
@@ -272,7 +595,7 @@ def sample_model(X_train, y_train, X_test):
     ]].copy()
 
     y_train_dvs = y_train.select_dtypes(exclude=['object'])
-    ridge = Ridge()
+    ridge = StreamingRidge(alpha)
     ridge.fit(X_train_features, y_train_dvs)
     y_pred_dvs = ridge.predict(X_test_features)
 
@@ -280,3 +603,53 @@ def sample_model(X_train, y_train, X_test):
         y_pred[crime_type] = y_pred_dvs[:, i]
 
     return y_pred
+
+
+def fit_ridge_by_chunks(encoder, first_date, last_date, months=12,
+                        alpha=1.0, dataset=None):
+    """Fit a ridge regression on more data than fits in memory.
+
+    The data is read a few months at a time, twice: once to learn the
+    encoder's categories, loading only the columns that they come from,
+    and once to add each chunk's encoded features and crime counts to a
+    StreamingRidge.
+
+    Parameters
+    ----------
+    encoder : FeatureEncoder
+        Describes the features. Any categories it has already learned
+        are discarded.
+    first_date, last_date : dates
+        Train on the days in [first_date, last_date)
+    months : integer, optional, default 12
+        The number of months to load at a time
+    alpha : float, optional, default 1.0
+    dataset : CrimeDataset, optional
+
+    Returns
+    -------
+    encoder : FeatureEncoder
+        The fitted encoder
+    ridge : StreamingRidge
+        The fitted model, with one target per crime type
+    """
+    if dataset is None:
+        dataset = CrimeDataset()
+
+    def get_columns(features):
+        return [col for col in features if col in dataset.columns]
+
+    encoder.categories = None
+    for chunk in dataset.iter_chunks(
+        first_date, last_date, months, get_columns(encoder.categorical)
+    ):
+        encoder.partial_fit(chunk)
+    ridge = StreamingRidge(alpha)
+    ridge.fit_chunks(
+        (encoder.transform(chunk), chunk[_CRIME_TYPES])
+        for chunk in dataset.iter_chunks(
+            first_date, last_date, months,
+            get_columns(encoder.categorical + encoder.numeric) + _CRIME_TYPES
+        )
+    )
+    return encoder, ridge
@@ -1,32 +1,49 @@
 """Functions to make crime predictions.
 Use MultinomialNB and Random Forest to predict
 """
-import numpy as np
-import pandas as pd
 import datetime
 import csv
 from sklearn.ensemble import RandomForestRegressor
+from joblib import Parallel, delayed
+from .features import encode_categorical_features
+
+def _fit_predict_forest(X_train, y_train, X_test, max_samples):
+    """Fit one forest and predict with it."""
+    clf = RandomForestRegressor(
+        max_depth=2, random_state=0, max_samples=max_samples
+    )
+    clf.fit(X_train, y_train)
+    return clf.predict(X_test)
+
 
 # Use RandomForestRegressor
-def sample_model_RF(X_train, y_train, X_test):
-    """Example model to perform ridge regression on each felony type."""
-    def add_categorical_features(X):
-        X_features = X[[
-            'ADDR_PCT_CD',
-            'COMPLAINT_MONTH',
-            'temperature',
-            'precipIntensity'
-        ]].copy()
-        X_features['COMPLAINT_DAY_HOUR'] = \
-            X['COMPLAINT_DAYOFWEEK'].astype(str) + '_' + \
-            X['COMPLAINT_HOURGROUP'].astype(str)
-        return pd.get_dummies(
-            X_features,
-            columns=['ADDR_PCT_CD', 'COMPLAINT_MONTH', 'COMPLAINT_DAY_HOUR']
-        )
+def sample_model_RF(X_train, y_train, X_test, multi_output=False,
+                    n_jobs=None, max_samples=None, cache=None):
+    """Example model to perform random forest regression on each felony type.
 
-    X_train_features = add_categorical_features(X_train)
-    X_test_features = add_categorical_features(X_test)
+    Parameters
+    ----------
+    X_train, y_train, X_test : DataFrames
+    multi_output : boolean, optional, default False
+        If True, fit one forest that predicts every felony type at once
+        instead of one forest per felony type. Its trees are shared, so
+        its predictions differ from the per-type forests'.
+    n_jobs : integer, optional
+        The number of threads to use. The per-type forests are fit at the
+        same time, or the multi-output forest's trees are. The
+        per-type predictions are the same for any n_jobs.
+    max_samples : integer or float, optional
+        The number (or fraction) of training rows drawn for each tree.
+        Defaults to as many as there are training rows.
+    cache : FeatureCache, optional
+        If given, the features are taken from this cache for X_train and
+        X_test
+    """
+    _, X_train_features, X_test_features = encode_categorical_features(
+        X_train, X_test, cache
+    )
+    # Forests are fit on CSC matrices. Convert once, not once per forest.
+    X_train_features = X_train_features.tocsc()
     y_pred = X_test[[
         'COMPLAINT_YEAR',
         'COMPLAINT_MONTH',
@@ -36,9 +53,27 @@ def sample_model_RF(X_train, y_train, X_test):
     ]].copy()
     crime_types = y_train.select_dtypes(exclude=['object']).columns
 
-    for crime_type in crime_types:
-        clf = RandomForestRegressor(max_depth=2, random_state=0)    
-        clf.fit(X_train_features, y_train[crime_type])
-        y_pred[crime_type] = clf.predict(X_test_features)
+    if multi_output:
+        clf = RandomForestRegressor(
+            max_depth=2, random_state=0, n_jobs=n_jobs,
+            max_samples=max_samples
+        )
+        clf.fit(X_train_features, y_train[crime_types])
+        y_pred_dvs = clf.predict(X_test_features).reshape(
+            len(X_test), len(crime_types)
+        )
+        for i, crime_type in enumerate(crime_types):
+            y_pred[crime_type] = y_pred_dvs[:, i]
+        return y_pred
+
+    predictions = Parallel(n_jobs=n_jobs, prefer='threads')(
+        delayed(_fit_predict_forest)(
+            X_train_features, y_train[crime_type], X_test_features,
+            max_samples
+        )
+        for crime_type in crime_types
+    )
+    for crime_type, prediction in zip(crime_types, predictions):
+        y_pred[crime_type] = prediction
 
     return y_pred
@@ -0,0 +1,207 @@
+"""Ridge regression fit from sums over chunks of data."""
+import numpy as np
+import scipy.linalg
+import scipy.sparse as sp
+
+
+class StreamingRidge(object):
+    """Ridge regression that sees the training data one chunk at a time.
+
+    Only the feature and target means and the centered X'X and X'y of
+    the rows seen so far are kept, so the memory used depends on the
+    number of features and targets, not the number of rows. The solution
+    is the same as sklearn's Ridge(alpha) with an intercept, for all of
+    the targets at once.
+
+    Parameters
+    ----------
+    alpha : float, optional, default 1.0
+        The regularization strength
+    """
+
+    def __init__(self, alpha=1.0):
+        self.alpha = alpha
+        self.reset()
+
+    def reset(self):
+        """Forget all the data seen so far."""
+        self.n_rows = 0
+        self.x_mean = None
+        self.y_mean = None
+        self.xx = None
+        self.xy = None
+        self.coef_ = None
+        self.intercept_ = None
+        self._eigen = None
+
+    def partial_fit(self, X, y):
+        """Add a chunk of rows to the sums.
+
+        The sums for the chunk are taken around the chunk's own means
+        and then merged into the running totals, which avoids the loss
+        of precision of accumulating raw sums of large values.
+
+        Parameters
+        ----------
+        X : array or sparse matrix of shape (n_rows, n_features)
+        y : array or DataFrame of shape (n_rows, n_targets)
+        """
+        if sp.issparse(X):
+            X = X.toarray()
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if y.ndim == 1:
+            y = y[:, np.newaxis]
+        n_chunk = len(X)
+        if n_chunk == 0:
+            return self
+        x_mean = X.mean(axis=0)
+        y_mean = y.mean(axis=0)
+        X_centered = X - x_mean
+        xx = X_centered.T @ X_centered
+        xy = X_centered.T @ (y - y_mean)
+        if self.n_rows == 0:
+            self.x_mean, self.y_mean, self.xx, self.xy = (
+                x_mean, y_mean, xx, xy
+            )
+        else:
+            n_rows = self.n_rows + n_chunk
+            weight = self.n_rows * n_chunk / n_rows
+            dx = x_mean - self.x_mean
+            dy = y_mean - self.y_mean
+            self.xx += xx + weight * np.outer(dx, dx)
+            self.xy += xy + weight * np.outer(dx, dy)
+            self.x_mean += dx * n_chunk / n_rows
+            self.y_mean += dy * n_chunk / n_rows
+        self.n_rows += n_chunk
+        self.coef_ = None
+        self.intercept_ = None
+        self._eigen = None
+        return self
+
+    def solve(self):
+        """Solve for the coefficients using the data seen so far."""
+        if self.n_rows == 0:
+            raise ValueError('No data has been seen')
+        coef = scipy.linalg.solve(
+            self.xx + self.alpha * np.eye(len(self.xx)), self.xy,
+            assume_a='pos'
+        )
+        self.coef_ = coef.T
+        self.intercept_ = self.y_mean - self.x_mean @ coef
+        return self
+
+    def _get_eigen(self):
+        """Return the eigendecomposition of X'X, and X'y in its basis."""
+        if self.n_rows == 0:
+            raise ValueError('No data has been seen')
+        if self._eigen is None:
+            eigenvalues, eigenvectors = scipy.linalg.eigh(self.xx)
+            self._eigen = (
+                eigenvalues, eigenvectors, eigenvectors.T @ self.xy
+            )
+        return self._eigen
+
+    def path(self, alphas):
+        """Solve for the coefficients at each of several alphas.
+
+        X'X is factorized once, after which each alpha costs about as
+        much as a matrix multiplication.
+
+        Parameters
+        ----------
+        alphas : array-like of floats
+
+        Returns
+        -------
+        coefs : ndarray of shape (n_alphas, n_targets, n_features)
+        intercepts : ndarray of shape (n_alphas, n_targets)
+        """
+        eigenvalues, eigenvectors, xy = self._get_eigen()
+        alphas = np.asarray(alphas, dtype=np.float64)
+        shrunk = xy / (eigenvalues + alphas[:, np.newaxis])[:, :, np.newaxis]
+        coefs = np.einsum('fk,akt->atf', eigenvectors, shrunk)
+        intercepts = self.y_mean - coefs @ self.x_mean
+        return coefs, intercepts
+
+    def score_path(self, alphas, X, y):
+        """Find the mean squared error on X and y at each of several alphas.
+
+        Parameters
+        ----------
+        alphas : array-like of floats
+        X : array or sparse matrix of shape (n_rows, n_features)
+        y : array or DataFrame of shape (n_rows, n_targets)
+
+        Returns
+        -------
+        mse : ndarray of shape (n_alphas, n_targets)
+        """
+        eigenvalues, eigenvectors, xy = self._get_eigen()
+        alphas = np.asarray(alphas, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if y.ndim == 1:
+            y = y[:, np.newaxis]
+        # Rows of X, centered and rotated into the eigenbasis.
+        X_rotated = np.asarray(X @ eigenvectors) - self.x_mean @ eigenvectors
+        y_centered = y - self.y_mean
+        mse = np.empty((len(alphas), y.shape[1]))
+        for i, alpha in enumerate(alphas):
+            residuals = (
+                X_rotated @ (xy / (eigenvalues + alpha)[:, np.newaxis]) -
+                y_centered
+            )
+            mse[i] = np.mean(residuals ** 2, axis=0)
+        return mse
+
+    def fit(self, X, y, chunksize=2**16):
+        """Fit on X and y, chunksize rows at a time."""
+        self.reset()
+        y = np.asarray(y)
+        for start in range(0, X.shape[0], chunksize):
+            self.partial_fit(
+                X[start:start + chunksize], y[start:start + chunksize]
+            )
+        return self.solve()
+
+    def fit_chunks(self, chunks):
+        """Fit on an iterable of (X, y) chunks."""
+        self.reset()
+        for X, y in chunks:
+            self.partial_fit(X, y)
+        return self.solve()
+
+    def predict(self, X):
+        """Predict every target for each row of X.
+
+        Returns
+        -------
+        y_pred : ndarray of shape (n_rows, n_targets)
+        """
+        if self.coef_ is None:
+            self.solve()
+        return np.asarray(X @ self.coef_.T) + self.intercept_
+
+
+def ridge_path(X_train, y_train, X_val, y_val, alphas, chunksize=2**16):
+    """Fit ridge regressions for a grid of alphas and score them.
+
+    Parameters
+    ----------
+    X_train, X_val : arrays or sparse matrices
+    y_train, y_val : arrays or DataFrames, with one column per target
+    alphas : array-like of floats
+    chunksize : integer, optional
+        The number of training rows to add to the sums at a time
+
+    Returns
+    -------
+    coefs : ndarray of shape (n_alphas, n_targets, n_features)
+    intercepts : ndarray of shape (n_alphas, n_targets)
+    mse : ndarray of shape (n_alphas, n_targets)
+        The mean squared error of each alpha and target on X_val, y_val
+    """
+    ridge = StreamingRidge()
+    ridge.fit(X_train, y_train, chunksize=chunksize)
+    coefs, intercepts = ridge.path(alphas)
+    return coefs, intercepts, ridge.score_path(alphas, X_val, y_val)
@@ -1,32 +1,45 @@
 """Functions to make crime predictions using a time-series model."""
 import numpy as np
 import pandas as pd
+from .calendar_dim import get_slot_ids
+
+
+def get_slot_precinct_keys(X, precincts):
+    """Number each (four-hour time slot, precinct) pair.
+
+    Slots are numbered from 1970-01-01, six per day, and precincts by
+    their position in the sorted array precincts.
+    """
+    slots = get_slot_ids(
+        X['COMPLAINT_YEAR'], X['COMPLAINT_MONTH'], X['COMPLAINT_DAY'],
+        X['COMPLAINT_HOURGROUP']
+    )
+    return (
+        slots * len(precincts) +
+        np.searchsorted(precincts, np.asarray(X['ADDR_PCT_CD']))
+    )
 
 
 def simple_time_series_model(X_train, y_train, X_test, y_test):
-    """Moving average of last four weeks."""
-    def get_decimal_date(X):
-        y = np.array(X['COMPLAINT_YEAR']-1970, dtype='<M8[Y]')
-        m = np.array(X['COMPLAINT_MONTH']-1, dtype='<m8[M]')
-        d = np.array(X['COMPLAINT_DAY']-1, dtype='<m8[D]')
-        mid_dates = y+m+d
-        m2 = np.zeros_like(y, dtype='<m8[M]')
-        d2 = np.zeros_like(y, dtype='<m8[D]')
-        start_dates = y+m2+d2
-        y3 = y + 1
-        end_dates = y3+m2+d2
-        decimal_date = pd.Series(
-            X['COMPLAINT_YEAR'].values + (
-                (mid_dates - start_dates) / (end_dates - start_dates)
-            ),
-            index=X.index
-        )
-        return decimal_date
+    """Moving average of last four weeks.
 
+    Each bucket is predicted by the mean of the same precinct, weekday
+    and hourgroup on the days 1 to 5 weeks earlier (the days strictly
+    between 6/365 and 37/365 of a year before it), over the training and
+    test rows that exist. Buckets with no such rows are predicted as 0.
+    """
     X_all = pd.concat([X_train, X_test])
-    X_all['DECIMAL_DATE'] = get_decimal_date(X_all)
     y_all = pd.concat([y_train, y_test])
-    all_all = pd.merge(X_all, y_all, left_index=True, right_index=True)
+    all_all = pd.merge(
+        X_all[[
+            'COMPLAINT_YEAR',
+            'COMPLAINT_MONTH',
+            'COMPLAINT_DAY',
+            'COMPLAINT_HOURGROUP',
+            'ADDR_PCT_CD'
+        ]],
+        y_all, left_index=True, right_index=True
+    )
 
     y_pred = X_test[[
         'COMPLAINT_YEAR',
@@ -35,36 +48,38 @@ def simple_time_series_model(X_train, y_train, X_test, y_test):
         'COMPLAINT_HOURGROUP',
         'ADDR_PCT_CD'
     ]].copy()
-
-    buckets = X_test[[
-        'COMPLAINT_YEAR',
-        'COMPLAINT_MONTH',
-        'COMPLAINT_DAY',
-        'COMPLAINT_HOURGROUP',
-        'COMPLAINT_DAYOFWEEK',
-    ]].copy().drop_duplicates()
-    buckets['DECIMAL_DATE'] = get_decimal_date(buckets)
-    preds = []
     y_train_dvs = y_train.select_dtypes(exclude=['object']).columns
-    for index, bucket in buckets.iterrows():
-        comparison = all_all[
-            (all_all['COMPLAINT_DAYOFWEEK'] == bucket['COMPLAINT_DAYOFWEEK']) &
-            (all_all['COMPLAINT_HOURGROUP'] == bucket['COMPLAINT_HOURGROUP']) &
-            (all_all['DECIMAL_DATE'] < (bucket['DECIMAL_DATE'] - 6/365)) &
-            (all_all['DECIMAL_DATE'] > (bucket['DECIMAL_DATE'] - 37/365))
-        ]
-        pred = comparison.groupby('ADDR_PCT_CD')[y_train_dvs].mean()
-        pred.reset_index(inplace=True)
-        for fld in [
-            'COMPLAINT_YEAR',
-            'COMPLAINT_MONTH',
-            'COMPLAINT_DAY',
-            'COMPLAINT_HOURGROUP',
-        ]:
-            pred[fld] = bucket[fld]
-        preds.append(pred)
-    all_preds = pd.concat(preds)
-    return y_pred.reset_index().merge(
-        all_preds,
-        how='left'
-    ).set_index('index').fillna(0)
+
+    precincts = np.union1d(all_all['ADDR_PCT_CD'], y_pred['ADDR_PCT_CD'])
+    week = 7 * 6 * len(precincts)
+    # The cells 1 to 5 weeks before each test row, and the distinct cells
+    # among them, which are the only ones whose sums are needed.
+    lag_keys = (
+        get_slot_precinct_keys(y_pred, precincts)[:, np.newaxis] -
+        week * np.arange(1, 6)
+    )
+    cells, lag_cells = np.unique(lag_keys, return_inverse=True)
+    lag_cells = lag_cells.reshape(lag_keys.shape)
+
+    data_keys = get_slot_precinct_keys(all_all, precincts)
+    data_cells = np.minimum(
+        np.searchsorted(cells, data_keys), max(len(cells) - 1, 0)
+    )
+    in_window = (
+        cells[data_cells] == data_keys if len(cells) > 0
+        else np.zeros(len(data_keys), dtype=bool)
+    )
+    data_cells = data_cells[in_window]
+
+    counts = np.bincount(data_cells, minlength=len(cells))
+    lag_counts = counts[lag_cells].sum(axis=1)
+    for crime_type in y_train_dvs:
+        sums = np.bincount(
+            data_cells,
+            weights=all_all[crime_type].values[in_window],
+            minlength=len(cells)
+        )
+        with np.errstate(invalid='ignore', divide='ignore'):
+            y_pred[crime_type] = sums[lag_cells].sum(axis=1) / lag_counts
+    y_pred.index.name = 'index'
+    return y_pred.fillna(0)
@@ -90,9 +90,16 @@ def write_weather_data(dates,
 
 
 def read_weather_data(filepath='../precrime_data/weather_hist.csv',
-                      local_timezone='America/New_York'):
-    """Load in the file of stored historical weather data."""
-    weather_hist = pd.read_csv(filepath)
+                      local_timezone='America/New_York',
+                      columns=None):
+    """Load in the file of stored historical weather data.
+
+    If columns is given, only those columns (and 'time') are read.
+    """
+    usecols = None
+    if columns is not None:
+        usecols = ['time'] + [col for col in columns if col != 'time']
+    weather_hist = pd.read_csv(filepath, usecols=usecols)
     weather_hist['Local_Datetime'] = pd.to_datetime(
         weather_hist['time'], unit='s'
     ).dt.tz_localize('UTC').dt.tz_convert(local_timezone)
@@ -114,8 +121,9 @@ def add_hourgroups(weather_hist):
 
 
 def load_weather_data(filepath='../precrime_data/weather_hist.csv',
-                      local_timezone='America/New_York'):
+                      local_timezone='America/New_York',
+                      columns=None):
     """Load in the file of stored weather data and add hourgroups."""
-    weather_hist = read_weather_data(filepath, local_timezone)
+    weather_hist = read_weather_data(filepath, local_timezone, columns)
     add_hourgroups(weather_hist)
     return weather_hist
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The notebooks import the modules package from exploratory-notebooks.
+sys.path.insert(
+    0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
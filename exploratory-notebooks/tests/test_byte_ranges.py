@@ -0,0 +1,84 @@
+"""Check that reading a file in byte ranges matches reading it whole."""
+import csv
+import functools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.nypd_data import (
+    get_byte_ranges, map_byte_ranges, read_orig_file, filter_felonies,
+    filter_raw_data, load_dated_felonies
+)
+
+
+@pytest.fixture
+def data_path(tmp_path):
+    """Write a small file in the layout of the original NYPD data."""
+    rng = np.random.RandomState(0)
+    with open(str(tmp_path / 'orig.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow([
+            'CMPLNT_NUM', 'CMPLNT_FR_DT', 'CMPLNT_FR_TM', 'CMPLNT_TO_DT',
+            'RPT_DT', 'KY_CD', 'OFNS_DESC', 'LAW_CAT_CD', 'BORO_NM',
+            'ADDR_PCT_CD', 'Latitude', 'Longitude'
+        ])
+        for i in range(500):
+            date = '{0:02d}/{1:02d}/{2}'.format(
+                rng.randint(1, 13), rng.randint(1, 29),
+                rng.randint(2006, 2016)
+            )
+            writer.writerow([
+                1000 + i,
+                '' if i % 37 == 0 else date,
+                '{0:02d}:{1:02d}:00'.format(
+                    rng.randint(0, 24), rng.randint(0, 60)
+                ),
+                '',
+                date,
+                rng.choice([105, 109, 341]),
+                'ROBBERY, "X"',
+                rng.choice(['FELONY', 'MISDEMEANOR']),
+                'BRONX',
+                '' if i % 11 == 0 else rng.randint(1, 124),
+                rng.uniform(),
+                rng.uniform(),
+            ])
+    return str(tmp_path) + '/'
+
+
+@pytest.mark.parametrize('n_ranges', [1, 3, 7])
+def test_read_orig_file_ranges(data_path, n_ranges):
+    byte_ranges = get_byte_ranges(data_path + 'orig.csv', n_ranges)
+    assert len(byte_ranges) == n_ranges
+    pd.testing.assert_frame_equal(
+        pd.concat([
+            read_orig_file(data_path, 'orig.csv', byte_range=byte_range)
+            for byte_range in byte_ranges
+        ]),
+        read_orig_file(data_path, 'orig.csv')
+    )
+
+
+def test_map_byte_ranges(data_path):
+    results = map_byte_ranges(
+        functools.partial(read_orig_file, data_path, 'orig.csv', None),
+        data_path + 'orig.csv', n_jobs=2, range_bytes=2**12
+    )
+    pd.testing.assert_frame_equal(
+        filter_felonies(pd.concat(list(results))),
+        filter_felonies(read_orig_file(data_path, 'orig.csv'))
+    )
+
+
+def test_load_dated_felonies_ranges(data_path):
+    filter_raw_data(
+        read_orig_file(data_path, 'orig.csv'), data_path + 'dated.csv'
+    )
+    pd.testing.assert_frame_equal(
+        pd.concat([
+            load_dated_felonies(data_path, 'dated.csv', byte_range)
+            for byte_range in get_byte_ranges(data_path + 'dated.csv', 4)
+        ]),
+        load_dated_felonies(data_path, 'dated.csv')
+    )
@@ -0,0 +1,110 @@
+"""Check that updating a count cube gives the same result as rebuilding it."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.count_cube import (
+    build_count_cube, update_count_cube, save_count_cube, load_count_cube
+)
+from modules.nypd_data import (
+    add_offense_category, add_datetime_columns, pivot_felonies,
+    save_pivoted_felonies, update_pivoted_felonies, load_pivoted_felonies,
+    load_pivoted_complaint_ids
+)
+
+
+def make_complaints(first_id, n_rows, first_date, n_days, precincts, seed):
+    """Make random complaints, as they are after cleaning."""
+    rng = np.random.RandomState(seed)
+    seconds = rng.randint(0, n_days * 24 * 60 * 60, n_rows)
+    nypd_data = pd.DataFrame(
+        {
+            'COMPLAINT_DATETIME': (
+                np.datetime64(first_date, 's') + seconds
+            ).astype('<M8[ns]'),
+            'KY_CD': rng.choice([101, 105, 106, 109, 117, 344], n_rows),
+            'ADDR_PCT_CD': rng.choice(precincts, n_rows),
+        },
+        index=pd.Index(
+            np.arange(first_id, first_id + n_rows), name='CMPLNT_NUM'
+        )
+    )
+    add_offense_category(nypd_data)
+    add_datetime_columns(nypd_data)
+    return nypd_data
+
+
+@pytest.fixture
+def old_data():
+    return make_complaints(1000, 2000, '2006-01-02', 28, [1, 5, 9], 0)
+
+
+@pytest.fixture(params=['same precincts', 'new precinct'])
+def new_data(request):
+    # Complaints for new days, plus late reports for days already in the
+    # cube, and, if asked for, complaints in a precinct the cube lacks.
+    precincts = [1, 5, 9]
+    if request.param == 'new precinct':
+        precincts = [1, 5, 7, 9]
+    return pd.concat([
+        make_complaints(5000, 500, '2006-01-30', 10, precincts, 1),
+        make_complaints(6000, 300, '2006-01-10', 20, precincts, 2),
+    ])
+
+
+def assert_cubes_equal(cube, expected):
+    np.testing.assert_array_equal(cube.days, expected.days)
+    np.testing.assert_array_equal(cube.hourgroups, expected.hourgroups)
+    np.testing.assert_array_equal(cube.precincts, expected.precincts)
+    assert list(cube.offenses) == list(expected.offenses)
+    np.testing.assert_array_equal(cube.counts, expected.counts)
+    np.testing.assert_array_equal(
+        cube.complaint_ids.ids, expected.complaint_ids.ids
+    )
+    np.testing.assert_array_equal(
+        cube.complaint_ids.offsets, expected.complaint_ids.offsets
+    )
+
+
+def test_update_count_cube(old_data, new_data):
+    cube, first_changed_day = update_count_cube(
+        build_count_cube(old_data), new_data
+    )
+    assert_cubes_equal(
+        cube, build_count_cube(pd.concat([old_data, new_data]))
+    )
+    assert cube.days[first_changed_day] == np.datetime64('2006-01-10')
+
+
+def test_update_count_cube_in_place(tmp_path, old_data, new_data):
+    filepath = str(tmp_path / 'felonies.cube')
+    save_count_cube(build_count_cube(old_data), filepath)
+    cube, _ = update_count_cube(
+        load_count_cube(filepath, mode='r+'), new_data
+    )
+    assert_cubes_equal(
+        cube, build_count_cube(pd.concat([old_data, new_data]))
+    )
+
+
+def test_update_count_cube_before_start(old_data):
+    early = make_complaints(9000, 10, '2006-01-01', 1, [1, 5, 9], 3)
+    with pytest.raises(ValueError):
+        update_count_cube(build_count_cube(old_data), early)
+
+
+def test_update_pivoted_felonies(tmp_path, old_data, new_data):
+    data_path = str(tmp_path) + '/'
+    save_pivoted_felonies(old_data, data_path=data_path)
+    update_pivoted_felonies(new_data, data_path=data_path)
+
+    all_data = pd.concat([old_data, new_data])
+    pd.testing.assert_frame_equal(
+        load_pivoted_felonies(data_path=data_path), pivot_felonies(all_data)
+    )
+    complaint_ids = load_pivoted_complaint_ids(data_path=data_path)
+    expected_ids = build_count_cube(all_data).complaint_ids
+    np.testing.assert_array_equal(complaint_ids.ids, expected_ids.ids)
+    np.testing.assert_array_equal(
+        complaint_ids.offsets, expected_ids.offsets
+    )
@@ -0,0 +1,51 @@
+"""Check that ensembles share features explicitly and see edits."""
+import numpy as np
+import pandas as pd
+
+from modules.ensemble import EnsembleModel, run_model, takes_y_test
+from modules.features import encode_categorical_features
+from modules.poly_ridge import poly_ridge_model
+
+from test_features import OFFENSES, make_data
+
+
+def test_ensemble_shares_features():
+    X_train, y_train = make_data(500, 0)
+    X_test, _ = make_data(100, 1)
+    encoded = []
+
+    def spy_model(X_train, y_train, X_test, cache=None):
+        encoded.append(encode_categorical_features(X_train, X_test, cache))
+        return poly_ridge_model(X_train, y_train, X_test, cache=cache)
+
+    EnsembleModel([spy_model, spy_model])(X_train, y_train, X_test)
+    assert encoded[0] is encoded[1]
+    # Each call has its own cache.
+    EnsembleModel([spy_model])(X_train, y_train, X_test)
+    assert encoded[2] is not encoded[0]
+
+
+def test_ensemble_sees_edits():
+    X_train, y_train = make_data(500, 0)
+    X_test, _ = make_data(100, 1)
+    ensemble = EnsembleModel([poly_ridge_model, poly_ridge_model])
+    before = ensemble(X_train, y_train, X_test)
+    pd.testing.assert_frame_equal(
+        before, poly_ridge_model(X_train, y_train, X_test)
+    )
+    X_test['temperature'] += 50
+    after = ensemble(X_train, y_train, X_test)
+    assert not np.allclose(before[OFFENSES].values, after[OFFENSES].values)
+
+
+def test_run_model_arguments():
+    def with_params(X_train, y_train, X_test, params):
+        return params
+
+    def with_y_test(X_train, y_train, X_test, y_test):
+        return y_test
+
+    assert not takes_y_test(with_params)
+    assert takes_y_test(with_y_test)
+    assert takes_y_test(EnsembleModel([with_y_test]))
+    assert run_model(with_y_test, None, None, None, 'y') == 'y'
@@ -0,0 +1,79 @@
+"""Check that models see edits to their data, and the feature cache."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.features import (
+    FeatureCache, encode_split, encode_categorical_features
+)
+from modules.poly_ridge import poly_ridge_model
+
+OFFENSES = ['Robbery', 'Burglary']
+
+
+def make_data(n_rows, seed):
+    """Make random rows in the format of split_into_X_y."""
+    rng = np.random.RandomState(seed)
+    dates = pd.DatetimeIndex(
+        np.datetime64('2007-01-01') + rng.randint(0, 365, n_rows)
+    )
+    X = pd.DataFrame({
+        'COMPLAINT_YEAR': dates.year,
+        'COMPLAINT_MONTH': dates.month,
+        'COMPLAINT_DAY': dates.day,
+        'COMPLAINT_HOURGROUP': 4 * rng.randint(0, 6, n_rows),
+        'ADDR_PCT_CD': rng.choice([1, 5, 9], n_rows),
+        'COMPLAINT_DAYOFWEEK': dates.dayofweek,
+        'temperature': rng.uniform(20, 90, n_rows),
+        'precipIntensity': rng.uniform(0, 0.1, n_rows),
+    })
+    y = pd.DataFrame({
+        offense: rng.poisson(0.5 + X['temperature'] / 100)
+        for offense in OFFENSES
+    })
+    return X, y
+
+
+@pytest.fixture
+def data():
+    X_train, y_train = make_data(500, 0)
+    X_test, _ = make_data(100, 1)
+    return X_train, y_train, X_test
+
+
+def test_encode_sees_edits(data):
+    X_train, _, X_test = data
+    _, _, before = encode_categorical_features(X_train, X_test)
+    X_test['temperature'] += 50
+    _, _, after = encode_categorical_features(X_train, X_test)
+    assert (after != before).nnz > 0
+
+
+def test_poly_ridge_model_sees_edits(data):
+    X_train, y_train, X_test = data
+    before = poly_ridge_model(X_train, y_train, X_test)
+    X_test['temperature'] += 50
+    after = poly_ridge_model(X_train, y_train, X_test)
+    assert not np.allclose(before[OFFENSES].values, after[OFFENSES].values)
+
+
+def test_sample_model_sees_edits(data):
+    prediction = pytest.importorskip('modules.prediction')
+    X_train, y_train, X_test = data
+    before = prediction.sample_model(X_train, y_train, X_test)
+    X_test['temperature'] += 50
+    after = prediction.sample_model(X_train, y_train, X_test)
+    assert not np.allclose(before[OFFENSES].values, after[OFFENSES].values)
+
+
+def test_feature_cache(data):
+    X_train, y_train, X_test = data
+    cache = FeatureCache(X_train, X_test)
+    first = encode_categorical_features(X_train, X_test, cache)
+    assert encode_categorical_features(X_train, X_test, cache) is first
+    pd.testing.assert_frame_equal(
+        poly_ridge_model(X_train, y_train, X_test, cache=cache),
+        poly_ridge_model(X_train, y_train, X_test)
+    )
+    with pytest.raises(ValueError):
+        encode_split(first[0], X_train, X_test.copy(), cache)
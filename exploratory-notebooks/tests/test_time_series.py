@@ -0,0 +1,131 @@
+"""Check the time series models against straightforward versions."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.count_cube import CountCube
+from modules.simple_time_series import simple_time_series_model
+from modules.fancy_time_series import fancy_time_series_model
+from modules.online_time_series import OnlineTimeSeriesForecaster
+
+KEY_COLUMNS = [
+    'COMPLAINT_YEAR', 'COMPLAINT_MONTH', 'COMPLAINT_DAY',
+    'COMPLAINT_HOURGROUP', 'ADDR_PCT_CD'
+]
+OFFENSES = ['Robbery', 'Burglary']
+
+
+def make_cube(first_date, n_days, seed):
+    """Make a cube of random counts, like a pivoted_felonies.cube file."""
+    rng = np.random.RandomState(seed)
+    hourgroups = np.arange(0, 24, 4)
+    precincts = np.array([1, 5, 9])
+    return CountCube(
+        np.datetime64(first_date, 'D') + np.arange(n_days),
+        hourgroups, precincts, OFFENSES,
+        rng.poisson(
+            0.7, (n_days, len(hourgroups), len(precincts), len(OFFENSES))
+        ).astype(np.int32)
+    )
+
+
+def split_cube(cube, test_date, last_date=None):
+    """Split a cube's rows into X_train, y_train, X_test, y_test.
+
+    The test rows are the days from test_date up to last_date, and the
+    training rows are the days before test_date.
+    """
+    frame = cube.slice_days(last_date=last_date).to_frame().reset_index()
+    dates = pd.to_datetime(pd.DataFrame({
+        'year': frame['COMPLAINT_YEAR'],
+        'month': frame['COMPLAINT_MONTH'],
+        'day': frame['COMPLAINT_DAY'],
+    }))
+    is_test = (dates >= pd.Timestamp(test_date)).values
+    X = frame[KEY_COLUMNS + ['COMPLAINT_DAYOFWEEK']]
+    y = frame[OFFENSES]
+    return X[~is_test], y[~is_test], X[is_test], y[is_test]
+
+
+def simple_reference(X_all, y_all, X_test):
+    """The mean of the rows 1 to 5 weeks before each test row."""
+    dates = pd.to_datetime(pd.DataFrame({
+        'year': X_all['COMPLAINT_YEAR'],
+        'month': X_all['COMPLAINT_MONTH'],
+        'day': X_all['COMPLAINT_DAY'],
+    }))
+    rows = {
+        (date, hourgroup, precinct): y_row
+        for date, hourgroup, precinct, y_row in zip(
+            dates, X_all['COMPLAINT_HOURGROUP'], X_all['ADDR_PCT_CD'],
+            y_all.values
+        )
+    }
+    expected = []
+    for _, row in X_test.iterrows():
+        date = pd.Timestamp(
+            row['COMPLAINT_YEAR'], row['COMPLAINT_MONTH'],
+            row['COMPLAINT_DAY']
+        )
+        history = [
+            rows[key] for key in (
+                (
+                    date - pd.Timedelta(weeks=weeks),
+                    row['COMPLAINT_HOURGROUP'], row['ADDR_PCT_CD']
+                )
+                for weeks in range(1, 6)
+            )
+            if key in rows
+        ]
+        expected.append(
+            np.mean(history, axis=0) if history
+            else np.zeros(len(OFFENSES))
+        )
+    return np.array(expected)
+
+
+@pytest.mark.parametrize('missing', [0, 0.3])
+def test_simple_time_series_model(missing):
+    # The test days straddle a year end, and some rows may be missing.
+    X_train, y_train, X_test, y_test = split_cube(
+        make_cube('2006-10-01', 110, 0), '2006-12-25'
+    )
+    rng = np.random.RandomState(1)
+    keep_train = rng.uniform(size=len(X_train)) >= missing
+    keep_test = rng.uniform(size=len(X_test)) >= missing
+    X_train, y_train = X_train[keep_train], y_train[keep_train]
+    X_test, y_test = X_test[keep_test], y_test[keep_test]
+
+    y_pred = simple_time_series_model(X_train, y_train, X_test, y_test)
+    assert list(y_pred.columns) == KEY_COLUMNS + OFFENSES
+    assert y_pred.index.equals(X_test.index)
+    np.testing.assert_allclose(
+        y_pred[OFFENSES].values,
+        simple_reference(
+            pd.concat([X_train, X_test]), pd.concat([y_train, y_test]),
+            X_test
+        )
+    )
+
+
+@pytest.mark.parametrize('model, batch_model', [
+    ('fancy', fancy_time_series_model),
+    ('simple', simple_time_series_model),
+])
+def test_online_forecaster(model, batch_model):
+    # Long enough for the 52-week ring buffer to wrap around.
+    cube = make_cube('2006-01-02', 400, 2)
+    forecaster = OnlineTimeSeriesForecaster.from_count_cube(
+        cube, last_date=cube.days[3], model=model
+    )
+    for i in range(3, len(cube.days)):
+        if i in (3, 40, 363, 364, 380, 399):
+            y_pred = batch_model(*split_cube(
+                cube, cube.days[i], last_date=cube.days[i] + 1
+            ))
+            np.testing.assert_allclose(
+                forecaster.forecast().reshape(-1, len(OFFENSES)),
+                y_pred[OFFENSES].values,
+                rtol=1e-12
+            )
+        forecaster.update(cube.counts[i], date=cube.days[i])